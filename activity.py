@@ -1,4 +1,12 @@
-from backend.models import update_user_status, record_event
+import atexit
+import datetime as dt
+import threading
+from concurrent.futures import Future
+
+from backend import presence
+from backend.models import update_user_status, record_event, record_status_batch
+
+VALID_STATUSES = {"shift_start", "active", "inactive"}
 
 
 def set_user_status(user_id: int, status: str, active_duration_seconds=None):
@@ -8,9 +16,141 @@ def set_user_status(user_id: int, status: str, active_duration_seconds=None):
     NOTE: We now also allow recording an 'active' event with active_duration_seconds representing
     the length of the *inactive* streak that just ended. This keeps a symmetric log so the admin
     app can sum true Active and Inactive time.
+
+    Returns the new activity_events id, or a Future resolving to it when buffered
+    ingestion is enabled (see enable_buffered_ingestion).
+    With presence.enable_presence() active, users.status is only rewritten when the
+    status actually changes.
     """
-    if status not in {"shift_start", "active", "inactive"}:
+    if status not in VALID_STATUSES:
         raise ValueError("Invalid status")
-    update_user_status(user_id, status)
-    record_event(user_id, status,
-                 active_duration_seconds=active_duration_seconds)
+    registry = presence.get_registry()
+    if _buffer is not None:
+        if registry is None:
+            return _buffer.submit(user_id, status, active_duration_seconds)
+        # The batch writes users; the registry undoes the change if that fails.
+        written = Future()
+        registry.observe(user_id, status, persist=False, written=written)
+        try:
+            fut = _buffer.submit(user_id, status, active_duration_seconds)
+        except Exception as e:
+            written.set_exception(e)
+            raise
+        fut.add_done_callback(lambda f: _chain(f, written))
+        return fut
+    if registry is not None:
+        registry.observe(user_id, status)
+    else:
+        update_user_status(user_id, status)
+    return record_event(user_id, status,
+                        active_duration_seconds=active_duration_seconds)
+
+
+def _chain(source: Future, target: Future):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+# ---------- buffered (write-behind) ingestion ----------
+
+
+class StatusBuffer:
+    """
+    Queues status transitions in memory and writes them with record_status_batch,
+    either every `flush_interval` seconds or once `batch_size` are pending.
+    At most `max_pending` transitions are held; submitters block past that.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, batch_size)
+        self._pending = []  # (user_id, status, duration, occurred_at, Future)
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="status-buffer", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, status, active_duration_seconds=None) -> Future:
+        fut = Future()
+        with self._cond:
+            while True:
+                if self._stopped:
+                    raise RuntimeError("Status buffer is stopped")
+                if len(self._pending) < self.max_pending:
+                    break
+                self._cond.notify_all()
+                self._cond.wait()
+            # Stamp now so the row keeps the agent's time, not the flush time.
+            self._pending.append(
+                (user_id, status, active_duration_seconds, dt.datetime.now(), fut))
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return fut
+
+    def flush(self):
+        """Write everything pending right now (blocking)."""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.batch_size]
+                    del self._pending[:self.batch_size]
+                    self._cond.notify_all()
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            ids = record_status_batch([row[:4] for row in batch])
+        except Exception as e:
+            for row in batch:
+                row[4].set_exception(e)
+            return
+        for row, eid in zip(batch, ids):
+            row[4].set_result(eid)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def stop(self, timeout=None):
+        """Stop accepting transitions and flush what is queued."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+_buffer = None
+
+
+def enable_buffered_ingestion(batch_size=500, flush_interval=1.0, max_pending=10000):
+    global _buffer
+    if _buffer is None:
+        _buffer = StatusBuffer(batch_size, flush_interval, max_pending)
+    return _buffer
+
+
+def disable_buffered_ingestion(timeout=None):
+    """Flush pending transitions and go back to synchronous writes."""
+    global _buffer
+    buf, _buffer = _buffer, None
+    if buf is not None:
+        buf.stop(timeout)
+
+
+atexit.register(disable_buffered_ingestion)
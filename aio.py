@@ -0,0 +1,157 @@
+# backend/aio.py
+"""
+Asyncio facade over backend.models.
+
+    from backend import aio
+    users = await aio.list_users(search="ali")
+    eid = await aio.record_event(uid, "inactive", active_duration_seconds=900)
+
+Every call runs the blocking models function on a dedicated thread pool sized
+to the DB connection pool. An asyncio.Semaphore admits that many calls at once;
+the rest wait as coroutines, not as queued threads, so hundreds of concurrent
+requests cost no extra threads or connections.
+
+Cancellation: a call cancelled while it waits for a slot never runs. Once a
+query is running it cannot be interrupted (pymysql is blocking), so it
+finishes in the background, its result is discarded and the slot is freed
+when it completes.
+"""
+import asyncio
+import weakref
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import models
+from backend.config import DB_POOL_CONFIG
+
+DEFAULT_CONCURRENCY = DB_POOL_CONFIG["size"] or 10
+
+_executor = None
+_limit = DEFAULT_CONCURRENCY
+_semaphores = weakref.WeakKeyDictionary()  # event loop -> Semaphore
+_lock = threading.Lock()
+_stats = {"running": 0, "waiting": 0, "completed": 0, "cancelled": 0}
+
+
+def configure(max_concurrency=DEFAULT_CONCURRENCY):
+    """Set the concurrency limit; call before the first query."""
+    global _limit
+    with _lock:
+        if _executor is not None:
+            raise RuntimeError("aio is already in use; configure it at startup")
+        _limit = max_concurrency
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_limit, thread_name_prefix="aio-db")
+        return _executor
+
+
+def _get_semaphore(loop) -> asyncio.Semaphore:
+    # The executor threads are shared; each event loop gets its own gate onto them.
+    with _lock:
+        sem = _semaphores.get(loop)
+        if sem is None:
+            sem = _semaphores[loop] = asyncio.Semaphore(_limit)
+        return sem
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking callable on the DB executor under the concurrency limit."""
+    loop = asyncio.get_running_loop()
+    sem = _get_semaphore(loop)
+    _count("waiting", 1)
+    try:
+        await sem.acquire()
+    except asyncio.CancelledError:
+        _count("cancelled", 1)
+        raise
+    finally:
+        _count("waiting", -1)
+    fut = _get_executor().submit(functools.partial(fn, *args, **kwargs))
+    _count("running", 1)
+
+    def done(f):
+        # Free the slot when the thread finishes, even if the awaiting task was cancelled.
+        _count("running", -1)
+        if not f.cancelled():
+            _count("completed", 1)
+        try:
+            loop.call_soon_threadsafe(sem.release)
+        except RuntimeError:
+            pass  # loop already closed
+
+    fut.add_done_callback(done)
+    try:
+        return await asyncio.shield(asyncio.wrap_future(fut))
+    except asyncio.CancelledError:
+        _count("cancelled", 1)
+        fut.cancel()  # only succeeds if the thread has not picked it up yet
+        raise
+
+
+def _count(key, delta):
+    with _lock:
+        _stats[key] += delta
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats, limit=_limit)
+
+
+def shutdown(wait=True):
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+        _semaphores.clear()
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _wrap(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+# ---------- models surface ----------
+
+# Users
+insert_user = _wrap(models.insert_user)
+admin_update_user = _wrap(models.admin_update_user)
+admin_delete_user = _wrap(models.admin_delete_user)
+get_user_by_username_or_email = _wrap(models.get_user_by_username_or_email)
+get_user_by_id = _wrap(models.get_user_by_id)
+list_users = _wrap(models.list_users)
+search_users = _wrap(models.search_users)
+update_user_status = _wrap(models.update_user_status)
+list_admin_emails = _wrap(models.list_admin_emails)
+
+# Events & history
+record_event = _wrap(models.record_event)
+record_status_batch = _wrap(models.record_status_batch)
+fetch_unnotified_inactive_events = _wrap(models.fetch_unnotified_inactive_events)
+mark_event_notified = _wrap(models.mark_event_notified)
+mark_events_notified = _wrap(models.mark_events_notified)
+fetch_user_inactive_history = _wrap(models.fetch_user_inactive_history)
+fetch_user_activity_page = _wrap(models.fetch_user_activity_page)
+fetch_activity_totals = _wrap(models.fetch_activity_totals)
+fetch_daily_activity = _wrap(models.fetch_daily_activity)
+
+# Overtime
+insert_overtime = _wrap(models.insert_overtime)
+fetch_overtime_sum = _wrap(models.fetch_overtime_sum)
+
+# Media
+insert_screenshot_url = _wrap(models.insert_screenshot_url)
+insert_recording_url = _wrap(models.insert_recording_url)
+fetch_screenshots_for_user = _wrap(models.fetch_screenshots_for_user)
+fetch_recordings_for_user = _wrap(models.fetch_recordings_for_user)
+save_user_avatar_from_path = _wrap(models.save_user_avatar_from_path)
+remove_user_avatar = _wrap(models.remove_user_avatar)
@@ -1,7 +1,16 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import threading
 import bcrypt
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
-from backend.models import insert_user, get_user_by_username_or_email
+from backend.config import SESSION_CONFIG
+from backend.models import (insert_user, get_user_by_username_or_email, get_user_by_id,
+                            bump_session_version)
 
 # ---------- password helpers ----------
 
@@ -13,6 +22,87 @@ def hash_password(plain: str) -> bytes:
 def verify_password(plain: str, hashed: bytes) -> bool:
     return bcrypt.checkpw(plain.encode("utf-8"), hashed)
 
+
+# bcrypt releases the GIL, so a small pool runs checks in parallel while capping
+# how many cores a burst of logins can take from everything else.
+_bcrypt_pool = None
+_bcrypt_pool_lock = threading.Lock()
+
+
+def _get_bcrypt_pool() -> ThreadPoolExecutor:
+    global _bcrypt_pool
+    if _bcrypt_pool is None:
+        with _bcrypt_pool_lock:
+            if _bcrypt_pool is None:
+                workers = SESSION_CONFIG["bcrypt_workers"] or os.cpu_count() or 1
+                _bcrypt_pool = ThreadPoolExecutor(max_workers=workers,
+                                                  thread_name_prefix="bcrypt")
+    return _bcrypt_pool
+
+
+def verify_password_async(plain: str, hashed: bytes):
+    """Future[bool] for a bcrypt check run on the bounded bcrypt pool."""
+    return _get_bcrypt_pool().submit(verify_password, plain, hashed)
+
+
+# ---------- session tokens ----------
+#   token = b64url("user_id:session_version:expires_at") "." b64url(HMAC-SHA256)
+#   Validation is an HMAC plus a version check against the cached user row; bumping
+#   users.session_version (logout-everywhere, password change) revokes every older token.
+
+_SECRET = SESSION_CONFIG["secret"].encode("utf-8")
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: bytes) -> bytes:
+    if not _SECRET:
+        # A per-process random key would make tokens fail on every other worker and
+        # after every restart; refuse instead of half-working.
+        raise RuntimeError("SESSION_SECRET is not set; session tokens are disabled")
+    return hmac.new(_SECRET, payload, hashlib.sha256).digest()
+
+
+def issue_session_token(user: dict, ttl: int = None) -> str:
+    ttl = SESSION_CONFIG["ttl"] if ttl is None else ttl
+    payload = f"{user['id']}:{user.get('session_version') or 0}:{int(time.time()) + ttl}"
+    raw = payload.encode("ascii")
+    return f"{_b64(raw)}.{_b64(_sign(raw))}"
+
+
+def validate_session_token(token: str):
+    """
+    user_id if `token` is authentic, unexpired and not revoked, else None.
+    The version comes from the user cache, which every write to the user in this
+    process invalidates (password change included); other processes see a
+    revocation within USER_CACHE_TTL seconds.
+    """
+    try:
+        body, sig = token.split(".", 1)
+        raw = _unb64(body)
+        if not hmac.compare_digest(_unb64(sig), _sign(raw)):
+            return None
+        user_id, version, expires = (int(x) for x in raw.decode("ascii").split(":"))
+    except (ValueError, AttributeError, UnicodeDecodeError):
+        return None
+    if expires < time.time():
+        return None
+    user = get_user_by_id(user_id)
+    if user is None or (user.get("session_version") or 0) != version:
+        return None
+    return user_id
+
+
+def revoke_sessions(user_id: int):
+    """Log the user out everywhere."""
+    bump_session_version(user_id)
+
 # ---------- shift helpers ----------
 
 
@@ -70,6 +160,14 @@ def login(login_text: str, password: str):
     user = get_user_by_username_or_email(login_text)
     if not user:
         return None
-    if verify_password(password, user["password_hash"]):
+    if verify_password_async(password, user["password_hash"]).result():
         return user
     return None
+
+
+def login_session(login_text: str, password: str):
+    """(user, session_token) on success, else None. Clients re-authenticate with the token."""
+    user = login(login_text, password)
+    if not user:
+        return None
+    return user, issue_session_token(user)
@@ -1,14 +1,30 @@
 # backend/retention.py
 import os
+import json
 import argparse
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
+from backend import partitions
 from backend.db import get_connection
+from backend.media_store import release_urls
 from backend.config import MEDIA_ROOT, MEDIA_BASE_URL
 
 BATCH_SIZE = 1000
 DEFAULT_DAYS = 35  # retention window
+DELETE_WORKERS = 8  # threads unlinking media files
+CHECKPOINT_PATH = os.path.join(MEDIA_ROOT, ".retention_checkpoint.json")
+
+# (table, timestamp column, url columns) in purge order: media before the events they reference
+MEDIA_TABLES = [
+    ("screenshots", "taken_at", ("url", "thumb_url")),
+    ("screen_recordings", "recorded_at", ("url",)),
+]
+ROW_TABLES = [
+    ("activity_events", "occurred_at"),
+    ("user_overtimes", "ot_date"),
+]
 
 
 def _safe_abspath_from_url(url: str) -> str | None:
@@ -30,104 +46,199 @@ def _safe_abspath_from_url(url: str) -> str | None:
     except Exception:
         return None
 
+# ---------- checkpointing ----------
 
-def _delete_files(paths: list[str]) -> int:
-    deleted = 0
-    for p in paths:
-        try:
-            if p and os.path.isfile(p):
-                os.remove(p)
-                deleted += 1
-        except Exception:
-            pass
-    return deleted
-
-
-def _select_ids_where_older(table: str, ts_col: str, cutoff, id_col: str = "id"):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(f"SELECT {id_col} FROM {table} WHERE {ts_col} < %s", (cutoff,))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [r[id_col] for r in rows]
-
-
-def _delete_by_ids(table: str, ids: list[int], id_col: str = "id") -> int:
-    if not ids:
-        return 0
-    conn = get_connection()
-    cur = conn.cursor()
-    total = 0
-    for i in range(0, len(ids), BATCH_SIZE):
-        batch = ids[i:i+BATCH_SIZE]
-        placeholders = ",".join(["%s"] * len(batch))
-        cur.execute(f"DELETE FROM {table} WHERE {id_col} IN ({placeholders})", batch)
-        total += cur.rowcount or 0
-    cur.close()
-    conn.close()
-    return total
-
-
-def _collect_media_urls(table: str, ts_col: str, cutoff) -> list[tuple[int, str]]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        f"""SELECT id, url FROM {table}
-            WHERE {ts_col} < %s AND url IS NOT NULL AND url <> ''""",
-        (cutoff,),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [(r["id"], r["url"]) for r in rows]
-
-
-def purge_old_data(days: int = DEFAULT_DAYS, dry_run: bool = False) -> None:
-    now = dt.datetime.utcnow()
-    cutoff_dt = now - dt.timedelta(days=days)       # for TIMESTAMP columns
-    cutoff_date = (now - dt.timedelta(days=days)).date()  # for DATE columns
-
-    print(f"[Retention] Purging items older than {days} days…")
-
-    # 1) screenshots (files + rows)
-    scr_rows = _collect_media_urls("screenshots", "taken_at", cutoff_dt)
-    scr_paths = [_safe_abspath_from_url(u) for (_id, u) in scr_rows]
-    scr_ids = [i for (i, _u) in scr_rows]
-    if dry_run:
-        print(f"[screenshots] would delete rows: {len(scr_ids)}; files: {sum(1 for p in scr_paths if p and os.path.isfile(p))}")
-    else:
-        deleted_files = _delete_files([p for p in scr_paths if p])
-        deleted_rows = _delete_by_ids("screenshots", scr_ids)
-        print(f"[screenshots] deleted rows: {deleted_rows}; files: {deleted_files}")
-
-    # 2) screen_recordings (files + rows)
-    rec_rows = _collect_media_urls("screen_recordings", "recorded_at", cutoff_dt)
-    rec_paths = [_safe_abspath_from_url(u) for (_id, u) in rec_rows]
-    rec_ids = [i for (i, _u) in rec_rows]
-    if dry_run:
-        print(f"[screen_recordings] would delete rows: {len(rec_ids)}; files: {sum(1 for p in rec_paths if p and os.path.isfile(p))}")
-    else:
-        deleted_files = _delete_files([p for p in rec_paths if p])
-        deleted_rows = _delete_by_ids("screen_recordings", rec_ids)
-        print(f"[screen_recordings] deleted rows: {deleted_rows}; files: {deleted_files}")
-
-    # 3) activity_events
-    ev_ids = _select_ids_where_older("activity_events", "occurred_at", cutoff_dt)
-    if dry_run:
-        print(f"[activity_events] would delete rows: {len(ev_ids)}")
-    else:
-        deleted_rows = _delete_by_ids("activity_events", ev_ids)
-        print(f"[activity_events] deleted rows: {deleted_rows}")
 
-    # 4) user_overtimes (DATE)
-    ot_ids = _select_ids_where_older("user_overtimes", "ot_date", cutoff_date)
-    if dry_run:
-        print(f"[user_overtimes] would delete rows: {len(ot_ids)}")
-    else:
-        deleted_rows = _delete_by_ids("user_overtimes", ot_ids)
-        print(f"[user_overtimes] deleted rows: {deleted_rows}")
+def _load_checkpoint(days: int):
+    try:
+        with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            cp = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cp.get("days") != days:
+        return None  # different window: start over
+    return cp
+
+
+def _save_checkpoint(cp):
+    tmp = CHECKPOINT_PATH + ".tmp"
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cp, f)
+    os.replace(tmp, CHECKPOINT_PATH)
 
+
+def _clear_checkpoint():
+    try:
+        os.remove(CHECKPOINT_PATH)
+    except OSError:
+        pass
+
+# ---------- purge phases ----------
+
+
+def _purge_media(conn, cur, table, ts_col, url_cols, cutoff, executor, stats, on_progress):
+    """
+    Walk expired rows oldest first in index-ordered chunks. Each chunk releases its
+    media and deletes its rows in one transaction, so the next SELECT starts right
+    after it and a rerun after a crash simply continues.
+    """
+    cols = ", ".join(url_cols)
+    while True:
+        cur.execute(f"""
+            SELECT id, {cols} FROM {table}
+            WHERE {ts_col} < %s
+            ORDER BY {ts_col}, id
+            LIMIT %s
+        """, (cutoff, BATCH_SIZE))
+        rows = cur.fetchall()
+        if not rows:
+            return
+        urls = [r[c] for r in rows for c in url_cols if r.get(c)]
+        ids = [r["id"] for r in rows]
+        placeholders = ",".join(["%s"] * len(ids))
+        conn.begin()
+        stats["files"] += release_urls(urls, cur=cur, executor=executor)
+        cur.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+        stats["rows"] += cur.rowcount or 0
+        conn.commit()
+        on_progress()
+        if len(rows) < BATCH_SIZE:
+            return
+
+
+def _drop_expired_partitions(conn, cur, table, url_cols, cutoff, executor, stats, on_progress):
+    """
+    Partitioned tables: drop every partition lying wholly before the cutoff. Media
+    references are released first (url columns are NULLed in the same transaction so
+    a resumed run never releases twice). Rows in the boundary partition are left for
+    the chunked row deletes that follow.
+    """
+    if not partitions.list_partitions(cur, table):
+        return
+    partitions.ensure_future_partitions(cur, table)
+    cols = ", ".join(url_cols)
+    has_url = " OR ".join(f"{c} IS NOT NULL" for c in url_cols)
+    for name in partitions.expired_partitions(cur, table, cutoff):
+        last_id = 0
+        while url_cols:
+            cur.execute(f"""
+                SELECT id, {cols} FROM {table} PARTITION ({name})
+                WHERE id > %s AND ({has_url})
+                ORDER BY id LIMIT %s
+            """, (last_id, BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            ids = [r["id"] for r in rows]
+            placeholders = ",".join(["%s"] * len(ids))
+            conn.begin()
+            stats["files"] += release_urls([r[c] for r in rows for c in url_cols if r.get(c)],
+                                           cur=cur, executor=executor)
+            cur.execute(f"""
+                UPDATE {table} PARTITION ({name}) SET {", ".join(f"{c}=NULL" for c in url_cols)}
+                WHERE id IN ({placeholders})
+            """, ids)
+            conn.commit()
+            on_progress()
+        partitions.drop_partition(cur, table, name)
+        stats["partitions"] = stats.get("partitions", 0) + 1
+        on_progress()
+
+
+def _count_media(cur, table, ts_col, url_cols, cutoff, stats):
+    """Dry run: same walk, but keyset-paged because nothing is deleted."""
+    cols = ", ".join(url_cols)
+    last_ts, last_id = None, 0
+    while True:
+        where = f"{ts_col} < %s"
+        params = [cutoff]
+        if last_ts is not None:
+            where += f" AND ({ts_col} > %s OR ({ts_col} = %s AND id > %s))"
+            params += [last_ts, last_ts, last_id]
+        cur.execute(f"""
+            SELECT id, {ts_col} AS ts, {cols} FROM {table}
+            WHERE {where} ORDER BY {ts_col}, id LIMIT %s
+        """, (*params, BATCH_SIZE))
+        rows = cur.fetchall()
+        if not rows:
+            return
+        stats["rows"] += len(rows)
+        for r in rows:
+            for c in url_cols:
+                p = _safe_abspath_from_url(r.get(c))
+                if p and os.path.isfile(p):
+                    stats["files"] += 1
+        last_ts, last_id = rows[-1]["ts"], rows[-1]["id"]
+
+
+def _purge_rows(cur, table, ts_col, cutoff, stats, on_progress):
+    """DELETE … ORDER BY … LIMIT in a loop: short transactions, no id lists in Python."""
+    while True:
+        cur.execute(
+            f"DELETE FROM {table} WHERE {ts_col} < %s ORDER BY {ts_col} LIMIT %s",
+            (cutoff, BATCH_SIZE))
+        n = cur.rowcount or 0
+        stats["rows"] += n
+        on_progress()
+        if n < BATCH_SIZE:
+            return
+
+
+def purge_old_data(days: int = DEFAULT_DAYS, dry_run: bool = False, resume: bool = True) -> None:
+    cp = _load_checkpoint(days) if (resume and not dry_run) else None
+    if cp:
+        cutoff_dt = dt.datetime.fromisoformat(cp["cutoff"])
+        print(f"[Retention] Resuming interrupted purge (cutoff {cutoff_dt:%Y-%m-%d %H:%M:%S})…")
+    else:
+        cutoff_dt = dt.datetime.utcnow() - dt.timedelta(days=days)  # for TIMESTAMP columns
+        cp = {"days": days, "cutoff": cutoff_dt.isoformat(), "done": [], "stats": {}}
+        print(f"[Retention] Purging items older than {days} days…")
+    cutoff_date = cutoff_dt.date()  # for DATE columns
+
+    def progress():
+        if not dry_run:
+            _save_checkpoint(cp)
+
+    with get_connection() as conn, conn.cursor() as cur, \
+            ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+        for table, ts_col, url_cols in MEDIA_TABLES:
+            stats = cp["stats"].setdefault(table, {"rows": 0, "files": 0})
+            if table not in cp["done"]:
+                if dry_run:
+                    _count_media(cur, table, ts_col, url_cols, cutoff_dt, stats)
+                else:
+                    _drop_expired_partitions(conn, cur, table, url_cols, cutoff_dt,
+                                             executor, stats, progress)
+                    _purge_media(conn, cur, table, ts_col, url_cols, cutoff_dt,
+                                 executor, stats, progress)
+                cp["done"].append(table)
+                progress()
+            verb = "would delete" if dry_run else "deleted"
+            print(f"[{table}] {verb} rows: {stats['rows']}; files: {stats['files']}"
+                  + (f"; partitions dropped: {stats['partitions']}" if stats.get("partitions") else ""))
+
+        for table, ts_col in ROW_TABLES:
+            cutoff = cutoff_date if ts_col == "ot_date" else cutoff_dt
+            stats = cp["stats"].setdefault(table, {"rows": 0, "files": 0})
+            if table not in cp["done"]:
+                if dry_run:
+                    cur.execute(f"SELECT COUNT(*) AS n FROM {table} WHERE {ts_col} < %s", (cutoff,))
+                    stats["rows"] = int(cur.fetchone()["n"])
+                else:
+                    if table in partitions.TS_COLUMNS:
+                        _drop_expired_partitions(conn, cur, table, (), cutoff,
+                                                 executor, stats, progress)
+                    _purge_rows(cur, table, ts_col, cutoff, stats, progress)
+                cp["done"].append(table)
+                progress()
+            verb = "would delete" if dry_run else "deleted"
+            print(f"[{table}] {verb} rows: {stats['rows']}"
+                  + (f"; partitions dropped: {stats['partitions']}" if stats.get("partitions") else ""))
+
+    if not dry_run:
+        _clear_checkpoint()
     print("[Retention] Done.")
 
 
@@ -135,5 +246,6 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Items older than this many days are purged")
     ap.add_argument("--dry-run", action="store_true", help="Preview without deleting")
+    ap.add_argument("--no-resume", action="store_true", help="Ignore a checkpoint left by an interrupted run")
     args = ap.parse_args()
-    purge_old_data(days=args.days, dry_run=args.dry_run)
+    purge_old_data(days=args.days, dry_run=args.dry_run, resume=not args.no_resume)
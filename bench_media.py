@@ -0,0 +1,120 @@
+# backend/bench_media.py
+"""
+Load test for the media server.
+
+Writes a thumbnail-sized and a video-sized file under MEDIA_ROOT/bench/, then
+hammers both URLs from N keep-alive client threads and prints requests/sec,
+throughput and latency percentiles per file.
+
+    python -m backend.media_server --prod &
+    python -m backend.bench_media --concurrency 32 --requests 2000
+"""
+import os
+import time
+import uuid
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+
+from backend.config import MEDIA_ROOT, MEDIA_BASE_URL
+
+SIZES = {"thumbnail": 24 * 1024, "video": 32 * 1024 * 1024}
+
+
+def _make_file(label, size):
+    directory = os.path.join(MEDIA_ROOT, "bench")
+    os.makedirs(directory, exist_ok=True)
+    ext = ".webp" if label == "thumbnail" else ".mp4"
+    name = f"{label}_{uuid.uuid4().hex}{ext}"
+    with open(os.path.join(directory, name), "wb") as f:
+        remaining = size
+        while remaining:
+            n = min(remaining, 1024 * 1024)
+            f.write(os.urandom(n))
+            remaining -= n
+    return name
+
+
+def _percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, int(round(pct / 100.0 * (len(sorted_vals) - 1))))
+    return sorted_vals[k]
+
+
+def run(url, concurrency, total):
+    parsed = urlparse(url)
+    latencies, errors, nbytes = [], [0], [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+        local, local_bytes, local_errors = [], 0, 0
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            started = time.perf_counter()
+            try:
+                conn.request("GET", parsed.path)
+                resp = conn.getresponse()
+                body = resp.read()
+                if resp.status != 200:
+                    local_errors += 1
+                local_bytes += len(body)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+                continue
+            local.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            nbytes[0] += local_bytes
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mb_per_s": nbytes[0] / elapsed / (1024 * 1024) if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base-url", default=MEDIA_BASE_URL, help="Media URL prefix of the server under test")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=1000, help="Requests per file size")
+    ap.add_argument("--video-requests", type=int, default=None, help="Override request count for the video file")
+    args = ap.parse_args()
+
+    created = []
+    try:
+        for label, size in SIZES.items():
+            name = _make_file(label, size)
+            created.append(os.path.join(MEDIA_ROOT, "bench", name))
+            count = args.video_requests if (label == "video" and args.video_requests) else args.requests
+            r = run(f"{args.base_url}/bench/{name}", args.concurrency, count)
+            print(f"{label:9s} {size // 1024:>8d} KiB  {r['rps']:9.1f} req/s  {r['mb_per_s']:8.1f} MiB/s  "
+                  f"p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  errors {r['errors']}")
+    finally:
+        for path in created:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
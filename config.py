@@ -37,3 +37,25 @@ MEDIA_AVATARS_DIR = os.path.join(MEDIA_ROOT, "avatars")
 
 # Public URL base for the Flask static server below
 MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "http://127.0.0.1:5000/media")
+
+# Connection pool used by backend.db.get_connection (size 0 disables pooling)
+DB_POOL_CONFIG = {
+    "size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "borrow_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+    "ping_interval": float(os.getenv("DB_POOL_PING_INTERVAL", "30")),
+}
+
+# Signed session tokens (backend.auth). SESSION_SECRET must be set (the same value on
+# every worker) to issue or validate tokens; without it they raise RuntimeError.
+SESSION_CONFIG = {
+    "secret": os.getenv("SESSION_SECRET", ""),
+    "ttl": int(os.getenv("SESSION_TTL", str(12 * 3600))),
+    "bcrypt_workers": int(os.getenv("BCRYPT_WORKERS", "0")),  # 0 = CPU count
+}
+
+# In-process cache of user rows (backend.models); size 0 disables it
+USER_CACHE_CONFIG = {
+    "size": int(os.getenv("USER_CACHE_SIZE", "5000")),
+    "ttl": float(os.getenv("USER_CACHE_TTL", "60")),
+}
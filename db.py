@@ -1,9 +1,20 @@
+import time
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
 import pymysql
-from pymysql.cursors import DictCursor
-from backend.config import DB_CONFIG
+from pymysql.constants import SERVER_STATUS
+from pymysql.cursors import DictCursor, SSDictCursor
+from backend.config import DB_CONFIG, DB_POOL_CONFIG
 
 
-def get_connection():
+class PoolTimeoutError(pymysql.err.OperationalError):
+    """Raised when no pooled connection became free within the borrow timeout."""
+
+
+def _connect():
     return pymysql.connect(
         host=DB_CONFIG["host"],
         port=DB_CONFIG["port"],
@@ -14,3 +25,305 @@ def get_connection():
         cursorclass=DictCursor,
         charset="utf8mb4",
     )
+
+
+class _Slot:
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+
+
+class PooledConnection:
+    """
+    Thin proxy over a pymysql connection borrowed from a ConnectionPool.
+    close() (or leaving a `with` block) hands the connection back instead of
+    tearing down the socket, so existing `conn.close()` callers just work.
+    """
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+        # If a caller forgets close(), give the slot back when we are collected.
+        self._finalizer = weakref.finalize(self, pool._reclaim, slot)
+
+    def __getattr__(self, name):
+        slot = self.__dict__.get("_slot")
+        if slot is None:
+            raise pymysql.err.InterfaceError("Connection already returned to pool")
+        return getattr(slot.raw, name)
+
+    @property
+    def raw(self):
+        return self._slot.raw
+
+    def close(self):
+        if self._slot is None:
+            return
+        slot, self._slot = self._slot, None
+        self._finalizer.detach()
+        self._pool._release(slot)
+
+    def invalidate(self):
+        """Drop the underlying socket instead of returning it (e.g. after an aborted stream)."""
+        if self._slot is None:
+            return
+        slot, self._slot = self._slot, None
+        self._finalizer.detach()
+        self._pool._discard(slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._slot is not None:
+            try:
+                self._slot.raw.rollback()
+            except Exception:
+                self.invalidate()
+                return False
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of pymysql connections.
+    - size:           max connections open at once (borrowed + idle)
+    - borrow_timeout: seconds a caller waits for a free connection
+    - max_lifetime:   connections older than this are recycled
+    - ping_interval:  idle connections unused for this long are pinged before reuse
+    """
+
+    def __init__(self, size=10, borrow_timeout=10.0, max_lifetime=1800.0,
+                 ping_interval=30.0, connect=_connect):
+        if size < 1:
+            raise ValueError("Pool size must be >= 1")
+        self.size = size
+        self.borrow_timeout = borrow_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+        self._stats = {
+            "acquired": 0,
+            "created": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    # -- borrowing --
+
+    def acquire(self, timeout=None):
+        timeout = self.borrow_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise pymysql.err.InterfaceError("Connection pool is closed")
+                if self._idle:
+                    slot = self._idle.pop()  # LIFO keeps the hot connections warm
+                    break
+                if self._open < self.size:
+                    slot = None
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {timeout:.1f}s waiting for a DB connection")
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+            self._in_use += 1
+            waited = time.monotonic() - started
+            self._stats["acquired"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+
+        try:
+            slot = self._checkout(slot)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, slot)
+
+    def _checkout(self, slot):
+        """Outside the lock: open, recycle or health-check the slot we got."""
+        now = time.monotonic()
+        if slot is not None and now - slot.created_at > self.max_lifetime:
+            self._close_quietly(slot.raw)
+            self._count("recycled")
+            slot = None
+        if slot is not None and now - slot.last_used > self.ping_interval:
+            try:
+                slot.raw.ping(reconnect=False)
+            except Exception:
+                self._close_quietly(slot.raw)
+                self._count("failed_health_checks")
+                slot = None
+        if slot is None:
+            slot = _Slot(self._connect())
+            self._count("created")
+        return slot
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        with conn:
+            yield conn
+
+    # -- returning --
+
+    def _release(self, slot):
+        raw = slot.raw
+        healthy = bool(getattr(raw, "open", True))
+        if healthy and (not raw.get_autocommit()
+                        or raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS):
+            # A caller left a transaction open or turned autocommit off: reset it.
+            try:
+                raw.rollback()
+                raw.autocommit(True)
+            except Exception:
+                healthy = False
+        expired = time.monotonic() - slot.created_at > self.max_lifetime
+        if not healthy or expired:
+            if expired:
+                self._count("recycled")
+            self._discard(slot)
+            return
+        slot.last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if self._closed:
+                self._open -= 1
+                self._close_quietly(raw)
+            else:
+                self._idle.append(slot)
+            self._cond.notify()
+
+    def _discard(self, slot):
+        self._close_quietly(slot.raw)
+        with self._cond:
+            self._in_use -= 1
+            self._open -= 1
+            self._cond.notify()
+
+    def _reclaim(self, slot):
+        # Called by the proxy finalizer; state of the socket is unknown.
+        self._discard(slot)
+
+    # -- maintenance --
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for slot in idle:
+            self._close_quietly(slot.raw)
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out.update(
+                size=self.size,
+                open=self._open,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                waiters=self._waiters,
+            )
+        out["wait_seconds_avg"] = (
+            out["wait_seconds_total"] / out["acquired"] if out["acquired"] else 0.0)
+        return out
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    size=DB_POOL_CONFIG["size"],
+                    borrow_timeout=DB_POOL_CONFIG["borrow_timeout"],
+                    max_lifetime=DB_POOL_CONFIG["max_lifetime"],
+                    ping_interval=DB_POOL_CONFIG["ping_interval"],
+                )
+    return _pool
+
+
+def get_connection():
+    """
+    Returns a connection usable as `with get_connection() as conn:`.
+    Pooled unless DB_POOL_SIZE=0; close() returns it to the pool either way.
+    """
+    if DB_POOL_CONFIG["size"] <= 0:
+        return _connect()
+    return get_pool().acquire()
+
+
+def pool_stats() -> dict:
+    if DB_POOL_CONFIG["size"] <= 0:
+        return {}
+    return get_pool().stats()
+
+
+def iter_query(sql, params=(), fetch_size=1000):
+    """
+    Yield rows (dicts) from an unbuffered server-side cursor, so memory stays
+    constant however many rows match. The connection is held until the generator
+    is exhausted; abandoning it early drops the socket rather than draining it.
+    """
+    conn = get_connection()
+    cur = conn.cursor(SSDictCursor)
+    finished = False
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+        finished = True
+    finally:
+        if finished:
+            cur.close()
+            conn.close()
+        elif hasattr(conn, "invalidate"):
+            conn.invalidate()
+        else:
+            conn.close()
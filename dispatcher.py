@@ -0,0 +1,125 @@
+# backend/dispatcher.py
+"""
+Inactivity alert dispatcher.
+
+Claims bounded batches of unnotified 'inactive' events (see
+models.claim_inactive_events), sends each admin one digest per batch and marks
+the whole batch notified in a single UPDATE. The claim is a token written in a
+short transaction, so no row locks or connection are held while mail is sent;
+any number of workers can run side by side and a crashed worker's batch is
+reclaimed once its lease expires.
+
+The batch is marked once every admin got the digest or permanently (5xx)
+refused it; a refusal is logged, not retried. A transient failure (timeout,
+4xx, dropped queue) releases the batch for the next poll, so admins who did get
+it see it again. After MAX_ATTEMPTS claims an event is marked regardless, which
+bounds those repeats.
+"""
+import time
+import argparse
+from collections import OrderedDict
+
+from backend.models import (claim_inactive_events, finish_inactive_claim,
+                            release_inactive_claim, list_admin_emails)
+from backend.notify import EmailRefused, deliver_email
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_INTERVAL = 30  # seconds between polls when the backlog is empty
+SEND_TIMEOUT = 60  # seconds to wait for one digest to be delivered
+MAX_ATTEMPTS = 5  # claims of one event before it is marked notified regardless
+
+
+class DeliveryError(RuntimeError):
+    pass
+
+
+def _fmt_duration(seconds) -> str:
+    if not seconds:
+        return "unknown"
+    minutes, sec = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {sec}s"
+    return f"{sec}s"
+
+
+def build_digest(events) -> tuple[str, str]:
+    """Subject and body for one batch, grouped by user."""
+    by_user = OrderedDict()
+    for ev in events:
+        by_user.setdefault(ev["user_id"], []).append(ev)
+
+    lines = []
+    for evs in by_user.values():
+        first = evs[0]
+        lines.append(f"{first['name']} ({first['username']}, {first['department']}) - "
+                     f"{len(evs)} event(s)")
+        for ev in evs:
+            lines.append(f"  - {ev['occurred_at']}: inactive after "
+                         f"{_fmt_duration(ev['active_duration_seconds'])} active")
+        lines.append("")
+    subject = (f"[Idle Tracker] {len(events)} inactivity alert(s) "
+               f"for {len(by_user)} user(s)")
+    return subject, "\n".join(lines)
+
+
+def dispatch_once(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Claim, send and mark one batch. Returns the number of events handled."""
+    recipients = [e for e in list_admin_emails() if e]
+    if not recipients:
+        return 0  # leave events pending until someone can receive them
+    # The lease outlives the worst case of every send timing out.
+    token, events = claim_inactive_events(batch_size, SEND_TIMEOUT * len(recipients) + 60)
+    if not events:
+        return 0
+    ids = [ev["id"] for ev in events]
+    failed = []
+    try:
+        subject, body = build_digest(events)
+        for addr in recipients:
+            try:
+                if not deliver_email(addr, subject, body, timeout=SEND_TIMEOUT):
+                    failed.append(addr)
+            except EmailRefused as e:
+                print(f"[Dispatcher] {addr} refused the digest ({e}); not retrying")
+    except BaseException:
+        release_inactive_claim(token, ids)
+        raise
+    if not failed:
+        finish_inactive_claim(token, ids)
+        return len(events)
+    exhausted = {ev["id"] for ev in events if ev["notify_attempts"] >= MAX_ATTEMPTS}
+    finish_inactive_claim(token, sorted(exhausted))
+    release_inactive_claim(token, [i for i in ids if i not in exhausted])
+    if exhausted:
+        print(f"[Dispatcher] giving up on {len(exhausted)} event(s) after {MAX_ATTEMPTS} attempts")
+    raise DeliveryError(f"digest to {', '.join(failed)} was not delivered")
+
+
+def run(batch_size: int = DEFAULT_BATCH_SIZE, interval: float = DEFAULT_INTERVAL) -> None:
+    """Drain the backlog in batches, then poll every `interval` seconds."""
+    while True:
+        try:
+            handled = dispatch_once(batch_size)
+        except DeliveryError as e:
+            print(f"[Dispatcher] {e}; batch left pending")
+            handled = 0
+        if handled:
+            print(f"[Dispatcher] notified {handled} event(s)")
+        if handled < batch_size:
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Events per digest")
+    ap.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Idle poll interval (s)")
+    ap.add_argument("--once", action="store_true", help="Drain the backlog and exit")
+    args = ap.parse_args()
+    if args.once:
+        while dispatch_once(args.batch_size) == args.batch_size:
+            pass
+    else:
+        run(batch_size=args.batch_size, interval=args.interval)
@@ -0,0 +1,233 @@
+# backend/events.py
+"""
+Live change feed for dashboards, shared by every process.
+
+Writers just commit their rows. Each serving process runs one poller thread
+(started by the first subscriber, idle while nobody listens) that tails
+activity_events, screenshots and screen_recordings by primary key and fans the
+new rows out to its subscribers from a ring buffer. Because the source of truth
+is the database, a dashboard sees the writes of every worker and host.
+
+Event ids are composite cursors "<activity_id>-<screenshot_id>-<recording_id>":
+the highest id of each table delivered so far. A reconnecting client sends its
+last one (SSE Last-Event-ID) and the gap is replayed from the database, so it
+survives restarts of the serving process. If the gap is larger than
+MAX_CATCHUP rows, or the cursor is unusable, the client gets a "reset" event and
+should reload its state.
+
+Event types (every status change is recorded as an activity event):
+    activity     {row_id, user_id, department, event_type, active_duration_seconds, occurred_at}
+    screenshot   {row_id, user_id, department, url, thumb_url, taken_at}
+    recording    {row_id, user_id, department, url, duration_seconds, recorded_at}
+
+Auto-increment ids become visible in commit order, not id order, so an id the
+poller skips over is re-checked for GAP_TIMEOUT seconds before it is given up
+as rolled back.
+"""
+import os
+import time
+import threading
+from itertools import islice
+from collections import deque
+
+from backend.models import fetch_feed_heads, fetch_feed_rows
+
+BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "10000"))
+POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "1.0"))
+MAX_CATCHUP = int(os.getenv("EVENT_MAX_CATCHUP", "10000"))
+GAP_TIMEOUT = 10.0  # seconds an id skipped by an open transaction is re-checked
+MAX_GAPS = 10000  # per table; beyond this, skipped ids are not tracked
+POLL_LIMIT = 1000
+
+# table -> event type; the order is the order of the cursor components
+TABLES = (("activity_events", "activity"),
+          ("screenshots", "screenshot"),
+          ("screen_recordings", "recording"))
+
+
+def format_cursor(cursor) -> str:
+    return "-".join(str(cursor[t]) for t, _ in TABLES)
+
+
+def parse_cursor(token: str) -> dict:
+    parts = token.split("-")
+    if len(parts) != len(TABLES):
+        raise ValueError(f"Invalid event id {token!r}")
+    return {t: int(p) for (t, _), p in zip(TABLES, parts)}
+
+
+def _to_events(table, rows, cursor):
+    """Rows -> events, advancing `cursor` (in place) past each one."""
+    kind = dict(TABLES)[table]
+    out = []
+    for row in rows:
+        cursor[table] = max(cursor[table], row["id"])
+        event = {k: v for k, v in row.items() if k != "id"}
+        event.update(id=format_cursor(cursor), type=kind, row_id=row["id"])
+        out.append(event)
+    return out
+
+
+def catch_up(start, end):
+    """
+    Events between two cursors, read from the database, or None if there are
+    more than MAX_CATCHUP of them.
+    """
+    cursor = dict(start)
+    out = []
+    for table, _kind in TABLES:
+        if end[table] <= start[table]:
+            continue
+        rows = fetch_feed_rows(table, start[table], end[table], limit=MAX_CATCHUP - len(out) + 1)
+        if len(out) + len(rows) > MAX_CATCHUP:
+            return None
+        out += _to_events(table, rows, cursor)
+    return out
+
+
+class EventFeed:
+    def __init__(self, buffer_size=BUFFER_SIZE, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._ring = deque(maxlen=buffer_size)  # (seq, event)
+        self._seq = 0
+        self._cursor = None  # highest id per table fanned out so far
+        self._gaps = {t: {} for t, _ in TABLES}  # table -> {skipped id: first seen}
+        self._subscribers = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.polls = 0
+
+    def _attach(self):
+        with self._cond:
+            self._subscribers += 1
+            if self._cursor is None:
+                self._cursor = fetch_feed_heads()
+                self._ring.clear()
+                for gaps in self._gaps.values():
+                    gaps.clear()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="event-feed", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _detach(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._subscribers:
+                    self._cursor = None  # re-read the heads when someone subscribes again
+                    self._cond.wait()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[Events] poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def poll(self) -> int:
+        """Read new rows from every table and fan them out. Returns how many."""
+        with self._cond:
+            if self._cursor is None:
+                return 0
+            cursor = dict(self._cursor)
+        now = time.monotonic()
+        batch = []
+        for table, _kind in TABLES:
+            gaps = self._gaps[table]
+            for gid, seen in list(gaps.items()):
+                if now - seen > GAP_TIMEOUT:
+                    del gaps[gid]  # rolled back (or auto_increment_increment > 1)
+            if gaps:
+                late = fetch_feed_rows(table, 0, ids=sorted(gaps))
+                for row in late:
+                    del gaps[row["id"]]
+                batch += _to_events(table, late, cursor)
+            rows = fetch_feed_rows(table, cursor[table], limit=POLL_LIMIT)
+            expected = cursor[table] + 1
+            for row in rows:
+                if len(gaps) < MAX_GAPS:
+                    for gid in range(expected, min(row["id"], expected + MAX_GAPS - len(gaps))):
+                        gaps[gid] = now
+                expected = row["id"] + 1
+            batch += _to_events(table, rows, cursor)
+        with self._cond:
+            self.polls += 1
+            for event in batch:
+                self._seq += 1
+                self._ring.append((self._seq, event))
+            self._cursor = cursor
+            if batch:
+                self._cond.notify_all()
+        return len(batch)
+
+    def _since(self, seq):
+        """Events after ring position `seq`, or None if some were already evicted."""
+        if not self._ring or seq >= self._seq:
+            return []
+        oldest = self._ring[0][0]
+        if seq < oldest - 1:
+            return None
+        return [e for _s, e in islice(self._ring, seq - oldest + 1, None)]
+
+    def subscribe(self, last_event_id=None, predicate=None, heartbeat=15.0):
+        """
+        Generator of events after `last_event_id` (default: from now on), filtered
+        by `predicate(event)`. Yields None every `heartbeat` seconds of silence so
+        callers can write keep-alives and notice closed clients.
+        """
+        self._attach()
+        try:
+            with self._cond:
+                seq, head = self._seq, dict(self._cursor)
+            backlog = []
+            if last_event_id is not None:
+                try:
+                    start = parse_cursor(str(last_event_id))
+                except ValueError:
+                    start = None
+                if start is not None and all(start[t] <= head[t] for t, _ in TABLES):
+                    backlog = catch_up(start, head)
+                else:
+                    backlog = None  # garbage, or ids this database never issued
+            if backlog is None:
+                backlog = [{"id": format_cursor(head), "type": "reset"}]
+            while True:
+                for event in backlog:
+                    if event["type"] == "reset" or predicate is None or predicate(event):
+                        yield event
+                with self._cond:
+                    batch = self._since(seq)
+                    if batch == []:
+                        self._cond.wait(heartbeat)
+                        batch = self._since(seq)
+                    seq, newest = self._seq, dict(self._cursor or head)
+                if batch is None:
+                    # Fell behind the ring: replay from the database instead.
+                    batch = catch_up(head, newest)
+                    if batch is None:
+                        batch = [{"id": format_cursor(newest), "type": "reset"}]
+                head = newest
+                if not batch:
+                    yield None
+                backlog = batch
+        finally:
+            self._detach()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"subscribers": self._subscribers, "buffered": len(self._ring),
+                    "polls": self.polls, "cursor": self._cursor and format_cursor(self._cursor),
+                    "gaps": sum(len(g) for g in self._gaps.values())}
+
+
+_feed = EventFeed()
+
+
+def get_feed() -> EventFeed:
+    return _feed
+
+
+def subscribe(last_event_id=None, predicate=None, heartbeat=15.0):
+    return _feed.subscribe(last_event_id, predicate, heartbeat)
@@ -0,0 +1,113 @@
+# backend/export.py
+"""
+Streaming export of raw activity events and media metadata.
+
+Rows come from an unbuffered server-side cursor (db.iter_query) and are written
+one at a time to gzip-compressed JSONL or CSV, so memory stays flat for any
+range.
+
+    python -m backend.export activity_events --start 2025-01-01 --end 2025-01-31 -o jan.jsonl.gz
+    python -m backend.export screenshots --user-id 7 -o u7.csv.gz
+"""
+import csv
+import sys
+import gzip
+import json
+import time
+import argparse
+import datetime as dt
+
+from backend.db import iter_query
+
+# table -> (columns, timestamp column)
+EXPORTS = {
+    "activity_events": (
+        ("id", "user_id", "event_type", "occurred_at", "active_duration_seconds", "notified"),
+        "occurred_at"),
+    "screenshots": (("id", "user_id", "event_id", "url", "thumb_url", "mime", "taken_at"), "taken_at"),
+    "screen_recordings": (
+        ("id", "user_id", "event_id", "url", "mime", "duration_seconds", "recorded_at"),
+        "recorded_at"),
+}
+PROGRESS_EVERY = 100_000
+
+
+def iter_export(table, user_ids=None, event_types=None, start_date=None, end_date=None,
+                fetch_size=5000):
+    """Yield rows (dicts) of `table`, oldest first, matching the filters."""
+    if table not in EXPORTS:
+        raise ValueError(f"Unknown export table {table}")
+    columns, ts_col = EXPORTS[table]
+    clauses, params = [], []
+    if user_ids:
+        clauses.append(f"user_id IN ({','.join(['%s'] * len(user_ids))})")
+        params += list(user_ids)
+    if event_types:
+        if table != "activity_events":
+            raise ValueError("event_type filters only apply to activity_events")
+        clauses.append(f"event_type IN ({','.join(['%s'] * len(event_types))})")
+        params += list(event_types)
+    if start_date:
+        clauses.append(f"{ts_col} >= %s")
+        params.append(dt.datetime.combine(start_date, dt.time()))
+    if end_date:
+        clauses.append(f"{ts_col} < %s")  # end_date is inclusive
+        params.append(dt.datetime.combine(end_date + dt.timedelta(days=1), dt.time()))
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    sql = f"SELECT {', '.join(columns)} FROM {table}{where} ORDER BY {ts_col}, id"
+    return iter_query(sql, tuple(params), fetch_size)
+
+
+def _jsonable(value):
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    return value
+
+
+def export(table, path, fmt=None, progress=None, **filters) -> dict:
+    """
+    Write the export to `path` (gzip). fmt is 'jsonl' or 'csv', inferred from the
+    name when omitted. Returns {"rows", "seconds", "rows_per_sec"}.
+    """
+    fmt = fmt or ("csv" if ".csv" in path.lower() else "jsonl")
+    columns, _ts = EXPORTS.get(table, ((), None))
+    started = time.monotonic()
+    n = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as out:
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(columns)
+        for row in iter_export(table, **filters):
+            if writer is not None:
+                writer.writerow([_jsonable(row[c]) for c in columns])
+            else:
+                out.write(json.dumps({k: _jsonable(v) for k, v in row.items()}))
+                out.write("\n")
+            n += 1
+            if progress and n % PROGRESS_EVERY == 0:
+                progress(n, time.monotonic() - started)
+    seconds = time.monotonic() - started
+    return {"rows": n, "seconds": round(seconds, 2),
+            "rows_per_sec": round(n / seconds, 1) if seconds else 0.0}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Export raw rows to gzip JSONL/CSV")
+    ap.add_argument("table", choices=sorted(EXPORTS))
+    ap.add_argument("-o", "--out", required=True, help="Output path (.jsonl.gz or .csv.gz)")
+    ap.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Override format detection")
+    ap.add_argument("--user-id", type=int, action="append", default=None, help="Repeat for several users")
+    ap.add_argument("--event-type", action="append", default=None,
+                    choices=["shift_start", "active", "inactive"], help="activity_events only")
+    ap.add_argument("--start", type=dt.date.fromisoformat, default=None, help="First day (YYYY-MM-DD)")
+    ap.add_argument("--end", type=dt.date.fromisoformat, default=None, help="Last day, inclusive")
+    args = ap.parse_args()
+
+    def show(n, seconds):
+        print(f"[Export] {n} rows, {n / seconds:.0f} rows/s", file=sys.stderr)
+
+    result = export(args.table, args.out, args.format, show, user_ids=args.user_id,
+                    event_types=args.event_type, start_date=args.start, end_date=args.end)
+    print(f"[Export] {result['rows']} rows in {result['seconds']}s "
+          f"({result['rows_per_sec']} rows/s) -> {args.out}")
@@ -1,24 +1,246 @@
 import os
-from flask import Flask, send_from_directory, abort
+import re
+import json
+import stat
+import time
+import argparse
+import mimetypes
+import threading
+from collections import OrderedDict
+from flask import Flask, Response, abort, request, send_file, stream_with_context
+from backend import events
 from backend.config import MEDIA_ROOT
 
 app = Flask(__name__)
 
+# Media files are never rewritten: names carry a content hash (media_store) or a uuid
+# (avatars, legacy captures), so that token is a strong validator and browsers can
+# cache the bytes for a year.
+_IMMUTABLE_NAME = re.compile(r"(?:^|_)([0-9a-f]{64}|[0-9a-f]{32})\.[A-Za-z0-9]+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
 
-@app.get("/media/<path:relpath>")
-def serve_media(relpath):
+STAT_CACHE_TTL = float(os.getenv("MEDIA_STAT_CACHE_TTL", "30"))
+STAT_CACHE_SIZE = int(os.getenv("MEDIA_STAT_CACHE_SIZE", "10000"))
+
+
+class _StatCache:
+    """relpath -> resolved file info, kept for `ttl` seconds (LRU-bounded)."""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def evict(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+_stat_cache = _StatCache(STAT_CACHE_TTL, STAT_CACHE_SIZE)
+
+
+def _resolve(relpath):
+    """Validated absolute path plus the headers we derive from it, or None."""
+    info = _stat_cache.get(relpath)
+    if info is not None:
+        return info
     # Only serve files beneath MEDIA_ROOT
     full_path = os.path.abspath(os.path.join(MEDIA_ROOT, relpath))
     root_abs = os.path.abspath(MEDIA_ROOT)
-    if not full_path.startswith(root_abs):
-        abort(404)
-    directory = os.path.dirname(full_path)
+    if not full_path.startswith(root_abs + os.sep):
+        return None
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
     filename = os.path.basename(full_path)
-    if not os.path.exists(full_path):
+    immutable = _IMMUTABLE_NAME.search(filename)
+    info = {
+        "path": full_path,
+        "name": filename,
+        "mtime": st.st_mtime,
+        "mimetype": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        "etag": immutable.group(1) if immutable else f"{st.st_mtime_ns:x}-{st.st_size:x}",
+        "immutable": bool(immutable),
+    }
+    _stat_cache.put(relpath, info)
+    return info
+
+
+@app.get("/media/<path:relpath>")
+def serve_media(relpath):
+    info = _resolve(relpath)
+    if info is None:
+        abort(404)
+    # conditional=True gives Range/206, If-Range, If-None-Match and
+    # If-Modified-Since (304) handling on top of ETag + Last-Modified. Passing the
+    # path (not an open file) lets Werkzeug know the size, which Range needs; full
+    # responses still go through wsgi.file_wrapper, i.e. sendfile under gunicorn.
+    try:
+        rv = send_file(
+            info["path"],
+            mimetype=info["mimetype"],
+            download_name=info["name"],
+            conditional=True,
+            etag=info["etag"],
+            last_modified=info["mtime"],
+            max_age=IMMUTABLE_MAX_AGE if info["immutable"] else 0,
+        )
+    except OSError:
+        _stat_cache.evict(relpath)  # purged since we cached it
         abort(404)
-    return send_from_directory(directory, filename)
+    if info["immutable"]:
+        rv.cache_control.public = True
+        rv.cache_control.immutable = True
+    else:
+        rv.cache_control.no_cache = True
+    return rv
+
+
+# ---------- live change feed ----------
+
+SSE_HEARTBEAT = 15.0  # seconds between keep-alive comments
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "0"))  # per process; 0 = serve() picks
+SSE_RETRY_AFTER = 10  # seconds a client turned away with 503 should wait
+
+_stream_slots = None  # BoundedSemaphore while /events streams are capped
+
+
+def limit_streams(max_streams):
+    """Cap concurrent /events streams in this process (None or 0: no cap)."""
+    global _stream_slots
+    _stream_slots = threading.BoundedSemaphore(max_streams) if max_streams else None
+
+
+limit_streams(SSE_MAX_STREAMS)
+
+
+def _event_filter(user_ids, department):
+    """Predicate for events.subscribe; every event carries its user's department."""
+    if not user_ids and not department:
+        return None
+
+    def matches(event):
+        if user_ids and event.get("user_id") not in user_ids:
+            return False
+        return not department or event.get("department") == department
+    return matches
+
+
+@app.get("/events")
+def event_stream():
+    """
+    Server-sent events: status changes, activity events and new media.
+    ?user_id=1&user_id=2 and ?department=... narrow the feed; Last-Event-ID (header,
+    or ?last_event_id= for the first connect) resumes after a disconnect.
+    Each stream holds a server thread for its lifetime, so beyond the process's
+    cap (see limit_streams) clients get 503 with Retry-After instead.
+    """
+    try:
+        user_ids = {int(u) for u in request.args.getlist("user_id")}
+        last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    except ValueError:
+        abort(400)
+    predicate = _event_filter(user_ids, request.args.get("department"))
+    slots = _stream_slots
+    if slots is not None and not slots.acquire(blocking=False):
+        return Response("Too many live streams on this worker; retry later.\n", status=503,
+                        mimetype="text/plain", headers={"Retry-After": str(SSE_RETRY_AFTER)})
+
+    def stream():
+        yield "retry: 3000\n\n"
+        for event in events.subscribe(last_id, predicate, SSE_HEARTBEAT):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield (f"id: {event['id']}\nevent: {event['type']}\n"
+                   f"data: {json.dumps(event, default=str)}\n\n")
+
+    rv = Response(stream_with_context(stream()), mimetype="text/event-stream",
+                  headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    if slots is not None:
+        rv.call_on_close(slots.release)  # runs even if the client left before the first byte
+    return rv
+
+# ---------- production serving ----------
+
+
+def serve(bind="127.0.0.1:5000", workers=None, threads=8, max_streams=None):
+    """
+    Multi-process, multi-threaded server for production.
+    Uses gunicorn (gthread workers; plain-HTTP full responses go out via
+    os.sendfile) and falls back to waitress where gunicorn is unavailable.
+    Each open /events stream holds one thread, so at most `max_streams` per
+    worker (default SSE_MAX_STREAMS, else half of `threads`) are admitted and the
+    rest of the threads always remain for media requests.
+    """
+    workers = workers or (os.cpu_count() or 1) * 2 + 1
+    max_streams = max_streams or SSE_MAX_STREAMS or max(1, threads // 2)
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+
+    if BaseApplication is not None:
+        limit_streams(max_streams)  # inherited by the forked workers
+
+        class _MediaApplication(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", bind)
+                self.cfg.set("workers", workers)
+                self.cfg.set("worker_class", "gthread")
+                self.cfg.set("threads", threads)
+                self.cfg.set("sendfile", True)
+                self.cfg.set("keepalive", 5)
+
+            def load(self):
+                return app
+
+        _MediaApplication().run()
+        return
+
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        raise RuntimeError("Install gunicorn (or waitress) for the production server.")
+    host, port = bind.rsplit(":", 1)
+    limit_streams(workers * max_streams)  # one process serves every thread
+    waitress_serve(app, host=host, port=int(port), threads=workers * threads)
 
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prod", action="store_true", help="Run the production server instead of Flask's")
+    ap.add_argument("--bind", default="127.0.0.1:5000")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default 2*CPU+1)")
+    ap.add_argument("--threads", type=int, default=8, help="Threads per worker")
+    ap.add_argument("--max-streams", type=int, default=None,
+                    help="Concurrent /events streams per worker (default half of --threads)")
+    args = ap.parse_args()
     os.makedirs(MEDIA_ROOT, exist_ok=True)
-    app.run(host="127.0.0.1", port=5000, debug=False)
+    if args.prod:
+        serve(args.bind, args.workers, args.threads, args.max_streams)
+    else:
+        host, port = args.bind.rsplit(":", 1)
+        app.run(host=host, port=int(port), debug=False)
@@ -0,0 +1,272 @@
+# backend/media_store.py
+"""
+Content-addressed, sharded storage for screenshots and recordings.
+
+A file with SHA-256 `abcdef...` of kind `screenshots` lives at
+MEDIA_ROOT/screenshots/ab/cd/abcdef....png. Identical captures therefore
+share one file; media_objects counts how many rows point at it, and the file
+is unlinked when the last reference is released.
+
+The media_objects row lock serialises store and release of the same object,
+so a file is never unlinked while another writer is taking a new reference.
+"""
+import os
+import re
+import uuid
+import hashlib
+import argparse
+
+from backend.db import get_connection
+from backend.config import MEDIA_ROOT, MEDIA_BASE_URL
+
+KINDS = ("screenshots", "recordings")
+_CA_RELPATH = re.compile(r"^(?:%s)/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[A-Za-z0-9]+$" % "|".join(KINDS))
+_READ_CHUNK = 1024 * 1024
+
+
+def shard_relpath(kind: str, digest: str, ext: str) -> str:
+    """'screenshots', 'abcd…', '.png' -> 'screenshots/ab/cd/abcd….png' (always '/'-separated)."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown media kind: {kind}")
+    return f"{kind}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+
+def url_for(relpath: str) -> str:
+    return f"{MEDIA_BASE_URL}/{relpath}"
+
+
+def abspath_for(relpath: str) -> str:
+    return os.path.join(MEDIA_ROOT, relpath.replace("/", os.sep))
+
+
+def relpath_from_url(url: str):
+    """Media-root-relative '/'-path for a media URL, or None if it points elsewhere."""
+    if not url:
+        return None
+    if url.startswith(MEDIA_BASE_URL):
+        rel = url[len(MEDIA_BASE_URL):]
+    else:
+        parts = url.split("/media/", 1)
+        if len(parts) != 2:
+            return None
+        rel = parts[1]
+    rel = rel.lstrip("/\\").replace("\\", "/")
+    if not rel or any(p in ("", ".", "..") for p in rel.split("/")):
+        return None
+    return rel
+
+
+def is_content_addressed(relpath) -> bool:
+    return bool(relpath and _CA_RELPATH.match(relpath))
+
+
+def _incoming_dir() -> str:
+    # Under MEDIA_ROOT so the final os.replace is a same-filesystem atomic rename.
+    path = os.path.join(MEDIA_ROOT, ".incoming")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _iter_chunks(source, chunk_size):
+    """Yield byte chunks from bytes, a binary file-like object or an iterable of chunks."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for i in range(0, len(view), chunk_size):
+            yield view[i:i + chunk_size]
+    elif hasattr(source, "read"):
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows: directories can't be opened
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _add_ref(cur, relpath, digest, size, count=1):
+    cur.execute("""
+        INSERT INTO media_objects (relpath, sha256, size_bytes, refcount)
+        VALUES (%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE refcount = refcount + VALUES(refcount)
+    """, (relpath, digest, size, count))
+
+
+def store_stream(kind: str, source, ext: str, chunk_size: int = _READ_CHUNK):
+    """
+    Stream `source` (bytes, binary file-like or iterable of byte chunks) into the
+    store without holding it in memory: chunks go to a temp file while SHA-256 and
+    size are computed, then the fsynced file is renamed into its shard and one
+    reference is taken. Nothing is visible at the final path until it is complete.
+    Returns (relpath, url).
+    """
+    h = hashlib.sha256()
+    size = 0
+    tmp_path = os.path.join(_incoming_dir(), f"{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb", buffering=chunk_size) as f:
+            for chunk in _iter_chunks(source, chunk_size):
+                h.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        digest = h.hexdigest()
+        relpath = shard_relpath(kind, digest, ext)
+        final_path = abspath_for(relpath)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        with get_connection() as conn, conn.cursor() as cur:
+            conn.begin()
+            _add_ref(cur, relpath, digest, size)
+            if not os.path.exists(final_path):
+                os.replace(tmp_path, final_path)
+                _fsync_dir(os.path.dirname(final_path))
+            conn.commit()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return relpath, url_for(relpath)
+
+
+def store_bytes(kind: str, data: bytes, ext: str):
+    """Store `data` (deduplicated) and take one reference. Returns (relpath, url)."""
+    return store_stream(kind, data, ext)
+
+
+def _unlink(path) -> int:
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+def _unlink_all(relpaths, executor=None) -> int:
+    paths = [abspath_for(rel) for rel in relpaths]
+    if executor is None or len(paths) < 2:
+        return sum(_unlink(p) for p in paths)
+    return sum(executor.map(_unlink, paths))
+
+
+def release_urls(urls, cur=None, executor=None) -> int:
+    """
+    Drop one reference per URL. Content-addressed files are unlinked when their
+    count reaches zero; legacy (non content-addressed) files under MEDIA_ROOT are
+    unlinked directly. Pass `executor` to unlink in parallel.
+    Returns the number of files removed.
+    """
+    counts, legacy = {}, []
+    for url in urls:
+        rel = relpath_from_url(url)
+        if rel is None:
+            continue
+        if is_content_addressed(rel):
+            counts[rel] = counts.get(rel, 0) + 1
+        else:
+            legacy.append(rel)
+    if not counts:
+        return _unlink_all(legacy, executor)
+    if cur is None:
+        with get_connection() as conn, conn.cursor() as own_cur:
+            conn.begin()
+            gone = _release_refs(own_cur, counts)
+            # Unlink before commit: the row locks keep concurrent writers of the same object waiting.
+            removed = _unlink_all(legacy + gone, executor)
+            conn.commit()
+        return removed
+    return _unlink_all(legacy + _release_refs(cur, counts), executor)
+
+
+def _release_refs(cur, counts) -> list:
+    """Decrement refcounts in bulk (caller owns the transaction). Returns relpaths now unreferenced."""
+    rels = sorted(counts)  # stable lock order across concurrent releasers
+    placeholders = ",".join(["%s"] * len(rels))
+    cur.execute(f"""
+        SELECT relpath, refcount FROM media_objects
+        WHERE relpath IN ({placeholders}) FOR UPDATE
+    """, tuple(rels))
+    current = {r["relpath"]: r["refcount"] for r in cur.fetchall()}
+    gone = []
+    for rel in rels:
+        left = current.get(rel, 0) - counts[rel]
+        if left > 0:
+            cur.execute("UPDATE media_objects SET refcount=%s WHERE relpath=%s", (left, rel))
+        else:
+            gone.append(rel)
+    if gone:
+        placeholders = ",".join(["%s"] * len(gone))
+        cur.execute(f"DELETE FROM media_objects WHERE relpath IN ({placeholders})", tuple(gone))
+    return gone
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK), b""):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+def migrate_legacy(table: str, kind: str, batch_size: int = 500) -> dict:
+    """
+    Rewrite rows of `table` whose url still points at a flat, timestamp-named
+    file: hash the file, move it into its shard (or drop it if an identical
+    object exists), take a reference and update the url in place.
+    """
+    stats = {"migrated": 0, "deduplicated": 0, "missing": 0}
+    last_id = 0
+    while True:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT id, url FROM {table}
+                WHERE id > %s AND url IS NOT NULL AND url <> ''
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cur.fetchall()
+        if not rows:
+            return stats
+        last_id = rows[-1]["id"]
+        for row in rows:
+            rel = relpath_from_url(row["url"])
+            if rel is None or is_content_addressed(rel):
+                continue
+            src = abspath_for(rel)
+            if not os.path.isfile(src):
+                stats["missing"] += 1
+                continue
+            digest, size = _hash_file(src)
+            new_rel = shard_relpath(kind, digest, os.path.splitext(src)[1])
+            final_path = abspath_for(new_rel)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            with get_connection() as conn, conn.cursor() as cur:
+                conn.begin()
+                _add_ref(cur, new_rel, digest, size)
+                if os.path.exists(final_path):
+                    os.remove(src)
+                    stats["deduplicated"] += 1
+                else:
+                    os.replace(src, final_path)
+                cur.execute(f"UPDATE {table} SET url=%s WHERE id=%s", (url_for(new_rel), row["id"]))
+                conn.commit()
+            stats["migrated"] += 1
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Media store maintenance")
+    ap.add_argument("command", choices=["migrate"], help="migrate: move legacy flat files into shards")
+    ap.add_argument("--batch-size", type=int, default=500)
+    args = ap.parse_args()
+    for table, kind in (("screenshots", "screenshots"), ("screen_recordings", "recordings")):
+        print(f"[{table}] {migrate_legacy(table, kind, args.batch_size)}")
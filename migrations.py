@@ -0,0 +1,244 @@
+"""
+Versioned schema migrations.
+
+Every schema change is appended to MIGRATIONS as (version, description, step),
+where step is either a list of SQL statements or a callable taking a cursor.
+Applied versions are recorded in schema_version, so starting up against an
+up-to-date database costs a single SELECT.
+
+MySQL auto-commits DDL, so a migration that fails halfway must be fixed by hand
+before re-running; keep each step small.
+"""
+import pymysql
+
+from backend.db import get_connection
+
+LOCK_NAME = "idle_tracker_schema_migrations"
+LOCK_TIMEOUT = 60
+ER_NO_SUCH_TABLE = 1146
+
+
+def _has_column(cur, table: str, column: str) -> bool:
+    cur.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cur.fetchone() is not None
+
+
+def _create_user_search_index(cur):
+    """
+    ngram FULLTEXT over the searchable user columns. InnoDB's default stopword list
+    would silently drop every bigram that equals a stopword ('an', 'at', 'in', ...),
+    so the index is built with stopwords disabled for this session.
+    """
+    cur.execute("SET SESSION innodb_ft_enable_stopword = 0")
+    try:
+        cur.execute("""ALTER TABLE users ADD FULLTEXT INDEX ft_users_search
+                         (username, name, department, email) WITH PARSER ngram""")
+    finally:
+        cur.execute("SET SESSION innodb_ft_enable_stopword = DEFAULT")
+
+
+def _baseline(cur):
+    """Tables as init_tables used to create them, including the columns added ad hoc."""
+    # USERS
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+      id INT AUTO_INCREMENT PRIMARY KEY,
+      username VARCHAR(100) NOT NULL UNIQUE,
+      name VARCHAR(150) NOT NULL,
+      department VARCHAR(150) NOT NULL,
+      email VARCHAR(255) NOT NULL UNIQUE,
+      password_hash VARBINARY(100) NOT NULL,
+      role ENUM('admin','user') NOT NULL DEFAULT 'user',
+      shift_start_time TIME NOT NULL DEFAULT '09:00:00',
+      shift_duration_seconds INT NOT NULL DEFAULT 32400,
+      status ENUM('off','shift_start','active','inactive') NOT NULL DEFAULT 'off',
+      last_status_change TIMESTAMP NULL DEFAULT NULL,
+      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB;""")
+    if not _has_column(cur, "users", "shift_end_time"):
+        cur.execute(
+            "ALTER TABLE users ADD COLUMN shift_end_time TIME NOT NULL DEFAULT '18:00:00'")
+    if not _has_column(cur, "users", "image_url"):
+        cur.execute("ALTER TABLE users ADD COLUMN image_url TEXT NULL")
+
+    # ACTIVITY EVENTS
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS activity_events (
+      id BIGINT AUTO_INCREMENT PRIMARY KEY,
+      user_id INT NOT NULL,
+      event_type ENUM('shift_start','active','inactive') NOT NULL,
+      occurred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      notified TINYINT(1) NOT NULL DEFAULT 0,
+      active_duration_seconds INT NULL,
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;""")
+
+    # SCREENSHOTS
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS screenshots (
+      id BIGINT AUTO_INCREMENT PRIMARY KEY,
+      user_id INT NOT NULL,
+      event_id BIGINT NULL,
+      taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      mime VARCHAR(64) NOT NULL DEFAULT 'image/png',
+      url TEXT,
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+      FOREIGN KEY (event_id) REFERENCES activity_events(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB;""")
+    if not _has_column(cur, "screenshots", "url"):
+        cur.execute("ALTER TABLE screenshots ADD COLUMN url TEXT")
+
+    # RECORDINGS
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS screen_recordings (
+      id BIGINT AUTO_INCREMENT PRIMARY KEY,
+      user_id INT NOT NULL,
+      event_id BIGINT NULL,
+      recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      duration_seconds INT NOT NULL,
+      mime VARCHAR(64) NOT NULL DEFAULT 'video/mp4',
+      url TEXT,
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+      FOREIGN KEY (event_id) REFERENCES activity_events(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB;""")
+    if not _has_column(cur, "screen_recordings", "url"):
+        cur.execute("ALTER TABLE screen_recordings ADD COLUMN url TEXT")
+
+    # OVERTIME
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_overtimes (
+      id BIGINT AUTO_INCREMENT PRIMARY KEY,
+      user_id INT NOT NULL,
+      ot_date DATE NOT NULL,
+      overtime_seconds INT NOT NULL DEFAULT 0,
+      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      UNIQUE KEY uniq_user_date (user_id, ot_date),
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;""")
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "indexes for history, notification, gallery and retention scans", [
+        """ALTER TABLE activity_events
+             ADD INDEX ix_ae_user_type_time (user_id, event_type, occurred_at),
+             ADD INDEX ix_ae_type_notified_time (event_type, notified, occurred_at),
+             ADD INDEX ix_ae_occurred_at (occurred_at)""",
+        """ALTER TABLE screenshots
+             ADD INDEX ix_scr_user_taken (user_id, taken_at),
+             ADD INDEX ix_scr_taken (taken_at)""",
+        """ALTER TABLE screen_recordings
+             ADD INDEX ix_rec_user_recorded (user_id, recorded_at),
+             ADD INDEX ix_rec_recorded (recorded_at)""",
+        "ALTER TABLE user_overtimes ADD INDEX ix_ot_date (ot_date)",
+    ]),
+    (3, "activity_events (user_id, occurred_at) for keyset history pages", [
+        "ALTER TABLE activity_events ADD INDEX ix_ae_user_time (user_id, occurred_at)",
+    ]),
+    (4, "user_daily_activity rollup, backfilled from activity_events", [
+        """CREATE TABLE IF NOT EXISTS user_daily_activity (
+             user_id INT NOT NULL,
+             activity_date DATE NOT NULL,
+             active_seconds BIGINT NOT NULL DEFAULT 0,
+             inactive_seconds BIGINT NOT NULL DEFAULT 0,
+             transitions INT NOT NULL DEFAULT 0,
+             PRIMARY KEY (user_id, activity_date),
+             INDEX ix_uda_date (activity_date),
+             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+           ) ENGINE=InnoDB""",
+        """INSERT INTO user_daily_activity
+             (user_id, activity_date, active_seconds, inactive_seconds, transitions)
+           SELECT user_id, DATE(occurred_at),
+                  COALESCE(SUM(CASE WHEN event_type='inactive' THEN active_duration_seconds END), 0),
+                  COALESCE(SUM(CASE WHEN event_type='active' THEN active_duration_seconds END), 0),
+                  COUNT(*)
+           FROM activity_events
+           GROUP BY user_id, DATE(occurred_at)""",
+    ]),
+    (5, "media_objects reference counts for content-addressed media", [
+        """CREATE TABLE IF NOT EXISTS media_objects (
+             relpath VARCHAR(191) NOT NULL PRIMARY KEY,
+             sha256 CHAR(64) NOT NULL,
+             size_bytes BIGINT NOT NULL,
+             refcount INT NOT NULL DEFAULT 1,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           ) ENGINE=InnoDB""",
+    ]),
+    (6, "screenshots.thumb_url for the transcode/thumbnail pipeline", [
+        "ALTER TABLE screenshots ADD COLUMN thumb_url TEXT NULL",
+    ]),
+    (7, "users.session_version so signed session tokens can be revoked", [
+        "ALTER TABLE users ADD COLUMN session_version INT NOT NULL DEFAULT 0",
+    ]),
+    (8, "ngram FULLTEXT index for user search", _create_user_search_index),
+    (9, "users.last_seen_at, flushed periodically by the presence registry", [
+        "ALTER TABLE users ADD COLUMN last_seen_at TIMESTAMP NULL DEFAULT NULL",
+    ]),
+    (10, "users (name, id) for keyset-paginated user lists", [
+        "ALTER TABLE users ADD INDEX ix_users_name_id (name, id)",
+    ]),
+    (11, "activity_events claim columns so alerts are sent outside the row locks", [
+        """ALTER TABLE activity_events
+             ADD COLUMN notify_claim CHAR(32) NULL,
+             ADD COLUMN notify_claimed_at TIMESTAMP NULL DEFAULT NULL,
+             ADD COLUMN notify_attempts TINYINT UNSIGNED NOT NULL DEFAULT 0""",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _current_version(cur):
+    try:
+        cur.execute("SELECT MAX(version) AS v FROM schema_version")
+    except pymysql.err.ProgrammingError as e:
+        if e.args and e.args[0] == ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    row = cur.fetchone()
+    return int(row["v"] or 0) if row else 0
+
+
+def migrate(target=None) -> int:
+    """Apply pending migrations up to `target` (default: latest). Returns the schema version."""
+    target = LATEST_VERSION if target is None else target
+    with get_connection() as conn, conn.cursor() as cur:
+        version = _current_version(cur)
+        if version >= target:
+            return version
+
+        # Several processes may start at once; only one of them migrates.
+        cur.execute("SELECT GET_LOCK(%s, %s) AS got", (LOCK_NAME, LOCK_TIMEOUT))
+        if not (cur.fetchone() or {}).get("got"):
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                  version INT NOT NULL PRIMARY KEY,
+                  description VARCHAR(255) NOT NULL,
+                  applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB""")
+            version = _current_version(cur)
+            for num, description, step in MIGRATIONS:
+                if num <= version or num > target:
+                    continue
+                if callable(step):
+                    step(cur)
+                else:
+                    for sql in step:
+                        cur.execute(sql)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s,%s)",
+                    (num, description))
+                version = num
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cur.fetchall()
+    return version
+
+
+if __name__ == "__main__":
+    print(f"Schema at version {migrate()}")
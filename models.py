@@ -1,26 +1,25 @@
 import os
+import re
 import uuid
+import base64
+import time
 import shutil
+import threading
 import datetime as dt
+from collections import OrderedDict
 from typing import Optional
+import pymysql
+from backend import media_store, thumbnails
 from backend.db import get_connection
+from backend.migrations import migrate
 from backend.config import (
-    MEDIA_ROOT, MEDIA_SCREENSHOTS_DIR, MEDIA_RECORDINGS_DIR, MEDIA_BASE_URL, MEDIA_AVATARS_DIR
+    MEDIA_ROOT, MEDIA_SCREENSHOTS_DIR, MEDIA_RECORDINGS_DIR, MEDIA_BASE_URL, MEDIA_AVATARS_DIR,
+    USER_CACHE_CONFIG,
 )
 
 # Helpers
 
 
-def _has_column(table: str, column: str) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(f"SHOW COLUMNS FROM {table} LIKE %s", (column,))
-    ok = cur.fetchone() is not None
-    cur.close()
-    conn.close()
-    return ok
-
-
 def _ensure_media_dirs():
     os.makedirs(MEDIA_SCREENSHOTS_DIR, exist_ok=True)
     os.makedirs(MEDIA_RECORDINGS_DIR, exist_ok=True)
@@ -34,91 +33,130 @@ def _now_stamp():
 
 
 def init_tables():
-    conn = get_connection()
-    cur = conn.cursor()
+    """Create or upgrade the schema; see backend.migrations."""
+    migrate()
 
-    # USERS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-      id INT AUTO_INCREMENT PRIMARY KEY,
-      username VARCHAR(100) NOT NULL UNIQUE,
-      name VARCHAR(150) NOT NULL,
-      department VARCHAR(150) NOT NULL,
-      email VARCHAR(255) NOT NULL UNIQUE,
-      password_hash VARBINARY(100) NOT NULL,
-      role ENUM('admin','user') NOT NULL DEFAULT 'user',
-      shift_start_time TIME NOT NULL DEFAULT '09:00:00',
-      shift_duration_seconds INT NOT NULL DEFAULT 32400,
-      status ENUM('off','shift_start','active','inactive') NOT NULL DEFAULT 'off',
-      last_status_change TIMESTAMP NULL DEFAULT NULL,
-      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    ) ENGINE=InnoDB;""")
-    if not _has_column("users", "shift_end_time"):
-        cur.execute(
-            "ALTER TABLE users ADD COLUMN shift_end_time TIME NOT NULL DEFAULT '18:00:00'")
-    # NEW: image_url column
-    if not _has_column("users", "image_url"):
-        cur.execute("ALTER TABLE users ADD COLUMN image_url TEXT NULL")
+# Users
+#   Full user rows are cached in-process for USER_CACHE_TTL seconds, keyed by id and
+#   by the login text (username or email) they were looked up with. Every write to
+#   users in this module invalidates the user's entries; the TTL bounds staleness
+#   for writes made by other processes.
+
+
+class _UserCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires, row)
+        self._keys = {}             # user id -> keys caching that user
+        # A miss hands out the current clock; put() drops the fill if that user was
+        # invalidated since (epoch > clock at read), so unrelated writes don't void it.
+        self._clock = 0
+        self._epochs = {}           # user id -> clock of its last invalidation
+        self._floor = 0             # fills that started before this are dropped for everyone
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[0] >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return dict(hit[1]), None
+            if hit is not None:
+                self._drop(key)
+            self.misses += 1
+            return None, self._clock
+
+    def put(self, key, row, started):
+        """Cache a row read after get() returned `started`, unless its user was invalidated since."""
+        if self.maxsize <= 0 or row is None:
+            return
+        with self._lock:
+            if started < self._floor or self._epochs.get(row["id"], 0) > started:
+                return  # invalidated while we were reading the row
+            self._data[key] = (time.monotonic() + self.ttl, dict(row))
+            self._data.move_to_end(key)
+            self._keys.setdefault(row["id"], set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key):
+        _expires, row = self._data.pop(key)
+        keys = self._keys.get(row["id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[row["id"]]
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            self._clock += 1
+            if len(self._epochs) + len(user_ids) > max(self.maxsize, 1024):
+                # Bound the epoch table: forget it and void every fill in flight instead.
+                self._epochs.clear()
+                self._floor = self._clock
+            for uid in user_ids:
+                self._epochs[uid] = self._clock
+                for key in self._keys.pop(uid, ()):
+                    self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._clock += 1
+            self._floor = self._clock
+            self._epochs.clear()
+            self._data.clear()
+            self._keys.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_user_cache = _UserCache(USER_CACHE_CONFIG["size"], USER_CACHE_CONFIG["ttl"])
+
+
+def invalidate_user_cache(*user_ids):
+    """Drop cached rows for `user_ids` (all users if none given)."""
+    if user_ids:
+        _user_cache.invalidate(*user_ids)
+    else:
+        _user_cache.clear()
 
-    # ACTIVITY EVENTS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS activity_events (
-      id BIGINT AUTO_INCREMENT PRIMARY KEY,
-      user_id INT NOT NULL,
-      event_type ENUM('shift_start','active','inactive') NOT NULL,
-      occurred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      notified TINYINT(1) NOT NULL DEFAULT 0,
-      active_duration_seconds INT NULL,
-      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    ) ENGINE=InnoDB;""")
-
-    # SCREENSHOTS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS screenshots (
-      id BIGINT AUTO_INCREMENT PRIMARY KEY,
-      user_id INT NOT NULL,
-      event_id BIGINT NULL,
-      taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      mime VARCHAR(64) NOT NULL DEFAULT 'image/png',
-      url TEXT,
-      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-      FOREIGN KEY (event_id) REFERENCES activity_events(id) ON DELETE SET NULL
-    ) ENGINE=InnoDB;""")
-    if not _has_column("screenshots", "url"):
-        cur.execute("ALTER TABLE screenshots ADD COLUMN url TEXT")
-
-    # RECORDINGS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS screen_recordings (
-      id BIGINT AUTO_INCREMENT PRIMARY KEY,
-      user_id INT NOT NULL,
-      event_id BIGINT NULL,
-      recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      duration_seconds INT NOT NULL,
-      mime VARCHAR(64) NOT NULL DEFAULT 'video/mp4',
-      url TEXT,
-      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-      FOREIGN KEY (event_id) REFERENCES activity_events(id) ON DELETE SET NULL
-    ) ENGINE=InnoDB;""")
-    if not _has_column("screen_recordings", "url"):
-        cur.execute("ALTER TABLE screen_recordings ADD COLUMN url TEXT")
-
-    # OVERTIME
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS user_overtimes (
-      id BIGINT AUTO_INCREMENT PRIMARY KEY,
-      user_id INT NOT NULL,
-      ot_date DATE NOT NULL,
-      overtime_seconds INT NOT NULL DEFAULT 0,
-      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      UNIQUE KEY uniq_user_date (user_id, ot_date),
-      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    ) ENGINE=InnoDB;""")
-
-    cur.close()
-    conn.close()
 
-# Users
+def user_cache_stats() -> dict:
+    return _user_cache.stats()
+
+
+# Callables (user_id, deleted) run after a user is created, edited or deleted here,
+# e.g. so the presence registry picks up renames and department moves.
+_user_listeners = []
+
+
+def add_user_listener(fn):
+    _user_listeners.append(fn)
+
+
+def remove_user_listener(fn):
+    if fn in _user_listeners:
+        _user_listeners.remove(fn)
+
+
+def _notify_user_change(user_id, deleted=False):
+    for fn in list(_user_listeners):
+        try:
+            fn(user_id, deleted)
+        except Exception as e:
+            print(f"[Models] user listener failed: {e}")
 
 
 def insert_user(username, name, department, email, password_hash,
@@ -126,20 +164,80 @@ def insert_user(username, name, department, email, password_hash,
                 shift_start_time="09:00:00",
                 shift_end_time="18:00:00",
                 shift_duration_seconds=32400):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO users (username, name, department, email, password_hash, role,
-                           shift_start_time, shift_end_time, shift_duration_seconds)
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    """, (username, name, department, email, password_hash, role,
-          shift_start_time, shift_end_time, shift_duration_seconds))
-    uid = cur.lastrowid
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (username, name, department, email, password_hash, role,
+                               shift_start_time, shift_end_time, shift_duration_seconds)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        """, (username, name, department, email, password_hash, role,
+              shift_start_time, shift_end_time, shift_duration_seconds))
+        uid = cur.lastrowid
+    _notify_user_change(uid)
     return uid
 
 
+_USER_INSERT_COLS = ("username", "name", "department", "email", "password_hash", "role",
+                     "shift_start_time", "shift_end_time", "shift_duration_seconds")
+
+
+def find_existing_logins(usernames, emails, chunk_size=1000):
+    """(taken usernames, taken emails), lower-cased, for the given candidates."""
+    usernames, emails = list(usernames), list(emails)
+    taken_users, taken_emails = set(), set()
+    with get_connection() as conn, conn.cursor() as cur:
+        for i in range(0, max(len(usernames), len(emails)), chunk_size):
+            u_part = usernames[i:i + chunk_size] or [None]
+            e_part = emails[i:i + chunk_size] or [None]
+            cur.execute(f"""
+                SELECT username, email FROM users
+                WHERE username IN ({','.join(['%s'] * len(u_part))})
+                   OR email IN ({','.join(['%s'] * len(e_part))})
+            """, tuple(u_part + e_part))
+            for r in cur.fetchall():
+                taken_users.add(r["username"].lower())
+                taken_emails.add(r["email"].lower())
+    return taken_users, taken_emails
+
+
+def insert_users(rows, batch_size=500):
+    """
+    Insert user dicts (keys as insert_user) with one multi-row INSERT per batch,
+    then read the ids back by username (ids of a multi-row INSERT are not
+    guaranteed consecutive, so lastrowid can't be extrapolated). A batch that hits
+    a unique-key conflict is rolled back and retried row by row so the others
+    still go in. Returns one (user_id, error) per row, in order.
+    """
+    results = []
+    row_sql = f"({','.join(['%s'] * len(_USER_INSERT_COLS))})"
+    insert_sql = f"INSERT INTO users ({', '.join(_USER_INSERT_COLS)}) VALUES "
+    name_at = _USER_INSERT_COLS.index("username")
+    with get_connection() as conn, conn.cursor() as cur:
+        for i in range(0, len(rows), batch_size):
+            batch = [tuple(r[c] for c in _USER_INSERT_COLS) for r in rows[i:i + batch_size]]
+            names = [values[name_at] for values in batch]
+            try:
+                conn.begin()
+                cur.execute(insert_sql + ",".join([row_sql] * len(batch)),
+                            tuple(v for values in batch for v in values))
+                cur.execute(f"SELECT id, username FROM users WHERE username IN "
+                            f"({','.join(['%s'] * len(names))})", tuple(names))
+                ids = {r["username"]: r["id"] for r in cur.fetchall()}
+                conn.commit()
+                results += [(ids.get(name), None) for name in names]
+            except pymysql.err.IntegrityError:
+                conn.rollback()
+                for values in batch:
+                    try:
+                        cur.execute(insert_sql + row_sql, values)
+                        results.append((cur.lastrowid, None))
+                    except pymysql.err.IntegrityError as e:
+                        results.append((None, str(e)))
+    for uid, _error in results:
+        if uid is not None:
+            _notify_user_change(uid)
+    return results
+
+
 def admin_update_user(user_id, **fields):
     if not fields:
         return
@@ -151,14 +249,15 @@ def admin_update_user(user_id, **fields):
         vals.append(v)
     if not cols:
         return
+    if fields.get("password_hash") is not None:
+        cols.append("session_version=session_version+1")  # log out existing sessions
     q = "UPDATE users SET " + ", ".join(cols) + " WHERE id=%s"
     vals.append(user_id)
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(q, tuple(vals))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(q, tuple(vals))
+        conn.commit()
+    _user_cache.invalidate(user_id)
+    _notify_user_change(user_id)
 
 
 def admin_delete_user(user_id):
@@ -169,115 +268,403 @@ def admin_delete_user(user_id):
             _try_delete_avatar_by_url(row["image_url"])
     except Exception:
         pass
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        conn.begin()
+        # Release the media references first, in this transaction, as retention does.
+        cur.execute("SELECT url, thumb_url FROM screenshots WHERE user_id=%s FOR UPDATE", (user_id,))
+        urls = [r[c] for r in cur.fetchall() for c in ("url", "thumb_url") if r[c]]
+        cur.execute("SELECT url FROM screen_recordings WHERE user_id=%s FOR UPDATE", (user_id,))
+        urls += [r["url"] for r in cur.fetchall() if r["url"]]
+        media_store.release_urls(urls, cur=cur)
+        # Partitioned tables (backend.partitions) have no FKs, so don't rely on CASCADE.
+        for table in ("screenshots", "screen_recordings", "activity_events"):
+            cur.execute(f"DELETE FROM {table} WHERE user_id=%s", (user_id,))
+        cur.execute("DELETE FROM users WHERE id=%s", (user_id,))
+        conn.commit()
+    _user_cache.invalidate(user_id)
+    _notify_user_change(user_id, deleted=True)
 
 
 def get_user_by_username_or_email(login):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT * FROM users WHERE username=%s OR email=%s LIMIT 1", (login, login))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row, started = _user_cache.get(("login", login))
+    if started is None:
+        return row
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT * FROM users WHERE username=%s OR email=%s LIMIT 1", (login, login))
+        row = cur.fetchone()
+    _user_cache.put(("login", login), row, started)
     return row
 
 
 def get_user_by_id(user_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE id=%s", (user_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row, started = _user_cache.get(("id", user_id))
+    if started is None:
+        return row
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT * FROM users WHERE id=%s", (user_id,))
+        row = cur.fetchone()
+    _user_cache.put(("id", user_id), row, started)
     return row
 
 
-def list_users(search=None, status=None, hide_admin=True):
-    """
-    Returns user cards for dashboard. Optional text search and status filter.
-    If hide_admin=True, excludes role='admin'.
-    """
-    conn = get_connection()
-    cur = conn.cursor()
-    clauses = []
-    vals = []
+def bump_session_version(user_id):
+    """Invalidate every session token issued to the user; returns the new version."""
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE users SET session_version=session_version+1 WHERE id=%s", (user_id,))
+        cur.execute("SELECT session_version FROM users WHERE id=%s", (user_id,))
+        row = cur.fetchone()
+        conn.commit()
+    _user_cache.invalidate(user_id)
+    return row["session_version"] if row else None
+
+
+_USER_CARD_COLS = """id, username, name, department, email, status, role,
+                 shift_start_time, shift_end_time, shift_duration_seconds, image_url"""
+_SEARCH_COLS = "username, name, department, email"
+_NGRAM_SIZE = 2  # innodb ngram_token_size; shorter terms fall back to substring LIKE
+_PREFIX_BOOST = 10
+_FULLTEXT_TERM = re.compile(r"^\w+$")  # safe inside a boolean-mode phrase
+
+
+def _search_terms(search):
+    """Split free text into whitespace-separated terms, kept verbatim (e.g. emails keep '@')."""
+    return search.split()
+
+
+def _uses_fulltext(term) -> bool:
+    return len(term) >= _NGRAM_SIZE and bool(_FULLTEXT_TERM.match(term))
+
+
+def _user_filter(search, status, hide_admin):
+    """(where_sql, params, score_sql, score_params) shared by list_users and search_users."""
+    clauses, vals = [], []
     if hide_admin:
         clauses.append("role <> 'admin'")
-    if search:
-        clauses.append(
-            "(username LIKE %s OR name LIKE %s OR department LIKE %s OR email LIKE %s)")
-        like = f"%{search}%"
-        vals.extend([like, like, like, like])
     if status and status in {"off", "shift_start", "active", "inactive"}:
         clauses.append("status = %s")
         vals.append(status)
+    terms = _search_terms(search or "")
+    indexed = [t for t in terms if _uses_fulltext(t)]
+    score_sql, score_vals = "0", []
+    if indexed:
+        # Every term must match; ngram phrase matching finds it anywhere in a word.
+        boolean = " ".join(f'+"{t}"' for t in indexed)
+        clauses.append(f"MATCH({_SEARCH_COLS}) AGAINST (%s IN BOOLEAN MODE)")
+        vals.append(boolean)
+        score_sql = f"MATCH({_SEARCH_COLS}) AGAINST (%s IN BOOLEAN MODE)"
+        score_vals.append(boolean)
+    for t in terms:
+        if not _uses_fulltext(t):
+            # Too short for an ngram, or punctuation the parser would split on ('@', '.'):
+            # plain substring match across all four columns, as before the index.
+            clauses.append(
+                "(username LIKE %s OR name LIKE %s OR department LIKE %s OR email LIKE %s)")
+            vals += [f"%{t}%"] * 4
+    if terms:
+        # Names and usernames starting with the first term rank above mid-word hits.
+        score_sql = f"({score_sql}) + {_PREFIX_BOOST} * (username LIKE %s OR name LIKE %s)"
+        score_vals += [f"{terms[0]}%", f"{terms[0]}%"]
     where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
-    cur.execute(f"""
-      SELECT id, username, name, department, email, status, role,
-             shift_start_time, shift_end_time, shift_duration_seconds, image_url
-      FROM users
-      {where}
-      ORDER BY name
-    """, tuple(vals))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    return where, vals, score_sql, score_vals
+
+
+def list_users(search=None, status=None, hide_admin=True):
+    """
+    Returns user cards for dashboard. Optional text search and status filter.
+    If hide_admin=True, excludes role='admin'.
+    Search uses the ngram FULLTEXT index; search_users pages and ranks the same matches.
+    """
+    where, vals, _score, _score_vals = _user_filter(search, status, hide_admin)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+          SELECT {_USER_CARD_COLS}
+          FROM users
+          {where}
+          ORDER BY name
+        """, tuple(vals))
+        rows = cur.fetchall()
     return rows
 
 
+def _encode_key_cursor(key, row_id) -> str:
+    raw = f"{key}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_key_cursor(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        key, row_id = raw.rsplit("|", 1)
+        return key, int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid pagination cursor") from e
+
+
+def search_users(search=None, status=None, hide_admin=True, cursor=None, page_size=50):
+    """
+    One page of user cards. With search text, best matches first (FULLTEXT relevance
+    plus a boost for name/username prefixes); without, by name. Keyset-paginated on
+    (rank, id) so deep pages cost the same as the first.
+    Returns {"rows": [...], "next_cursor": str or None, "total": int}; total is
+    computed on the first page only (None when a cursor is passed).
+    """
+    where, vals, score_sql, score_vals = _user_filter(search, status, hide_admin)
+    ranked = bool(_search_terms(search or ""))
+    page_vals = []
+    if cursor:
+        key, last_id = _decode_key_cursor(cursor)
+        page_vals = [key, key, last_id]
+    with get_connection() as conn, conn.cursor() as cur:
+        if ranked:
+            # Relevance is computed per row, so rank the matches and page over them.
+            page_where = "WHERE (sort_key < %s OR (sort_key = %s AND id > %s))" if cursor else ""
+            cur.execute(f"""
+                SELECT * FROM (
+                  SELECT {_USER_CARD_COLS}, CAST({score_sql} AS DECIMAL(16,6)) AS sort_key
+                  FROM users
+                  {where}
+                ) matches
+                {page_where}
+                ORDER BY sort_key DESC, id
+                LIMIT %s
+            """, tuple(score_vals) + tuple(vals) + tuple(page_vals) + (page_size + 1,))
+        else:
+            # Seek on ix_users_name_id (name, id): each page reads only its own rows.
+            page_where = ""
+            if cursor:
+                page_where = (" AND " if where else " WHERE ") + "(name > %s OR (name = %s AND id > %s))"
+            cur.execute(f"""
+                SELECT {_USER_CARD_COLS}, name AS sort_key
+                FROM users
+                {where}{page_where}
+                ORDER BY name, id
+                LIMIT %s
+            """, tuple(vals) + tuple(page_vals) + (page_size + 1,))
+        rows = cur.fetchall()
+        total = None
+        if not cursor:
+            cur.execute(f"SELECT COUNT(*) AS n FROM users {where}", tuple(vals))
+            total = int(cur.fetchone()["n"])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = _encode_key_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+    for r in rows:
+        r.pop("sort_key", None)
+    return {"rows": rows, "next_cursor": next_cursor, "total": total}
+
+
 def update_user_status(user_id, status):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE users SET status=%s, last_status_change=NOW() WHERE id=%s", (status, user_id))
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE users SET status=%s, last_status_change=NOW() WHERE id=%s", (status, user_id))
+    _user_cache.invalidate(user_id)
+
+
+def fetch_presence_rows():
+    """Every user's presence fields, for seeding backend.presence."""
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, username, name, department, role, status, last_status_change, last_seen_at
+            FROM users
+        """)
+        rows = cur.fetchall()
+    return rows
+
+
+def update_last_seen(seen):
+    """seen: {user_id: datetime}. One UPDATE for the whole batch."""
+    if not seen:
+        return
+    cases, vals = [], []
+    for user_id, at in seen.items():
+        cases.append("WHEN %s THEN %s")
+        vals += [user_id, at]
+    ids = list(seen)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            UPDATE users SET last_seen_at = CASE id {' '.join(cases)} END
+            WHERE id IN ({','.join(['%s'] * len(ids))})
+        """, tuple(vals + ids))
+    # Cached user rows are deliberately left alone: a last_seen_at up to
+    # USER_CACHE_TTL old is fine there, and the registry is the live source.
 
 # Events & History
 
 
 def record_event(user_id, event_type, active_duration_seconds=None, notified=0):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO activity_events (user_id, event_type, active_duration_seconds, notified)
-        VALUES (%s,%s,%s,%s)
-    """, (user_id, event_type, active_duration_seconds, notified))
-    eid = cur.lastrowid
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        conn.begin()
+        cur.execute("""
+            INSERT INTO activity_events (user_id, event_type, active_duration_seconds, notified)
+            VALUES (%s,%s,%s,%s)
+        """, (user_id, event_type, active_duration_seconds, notified))
+        eid = cur.lastrowid
+        _rollup_events(cur, "id = %s", (eid,))
+        conn.commit()
     return eid
 
 
-def fetch_unnotified_inactive_events():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT ae.id, ae.user_id, u.username, u.email, u.name, u.department,
-               ae.event_type, ae.occurred_at, ae.active_duration_seconds
-        FROM activity_events ae
-        JOIN users u ON u.id = ae.user_id
-        WHERE ae.event_type='inactive' AND ae.notified=0
-        ORDER BY ae.occurred_at DESC
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+def record_status_batch(transitions):
+    """
+    Write many status transitions in one transaction.
+    transitions: list of (user_id, status, active_duration_seconds, occurred_at), oldest first.
+    - one INSERT per transition on a single connection, so each lastrowid is that
+      row's real id (a multi-row INSERT's ids are not guaranteed consecutive under
+      innodb_autoinc_lock_mode=2 or auto_increment_increment > 1)
+    - one UPDATE of users.status keeping only the latest transition per user
+    Returns the new activity_events ids in the same order as `transitions`.
+    """
+    if not transitions:
+        return []
+    latest = {}
+    for user_id, status, _dur, occurred_at in transitions:
+        latest[user_id] = (status, occurred_at)
+
+    status_cases, time_cases, case_vals, time_vals = [], [], [], []
+    for user_id, (status, occurred_at) in latest.items():
+        status_cases.append("WHEN %s THEN %s")
+        case_vals += [user_id, status]
+        time_cases.append("WHEN %s THEN %s")
+        time_vals += [user_id, occurred_at]
+    user_ids = list(latest)
+
+    event_ids = []
+    with get_connection() as conn, conn.cursor() as cur:
+        conn.begin()
+        for row in transitions:
+            cur.execute("""
+                INSERT INTO activity_events (user_id, event_type, active_duration_seconds, occurred_at)
+                VALUES (%s,%s,%s,%s)
+            """, row)
+            event_ids.append(cur.lastrowid)
+        # Exactly our rows: other sessions' inserts may interleave with this id range.
+        _rollup_events(cur, f"id IN ({','.join(['%s'] * len(event_ids))})", tuple(event_ids))
+        cur.execute(f"""
+            UPDATE users
+            SET status = CASE id {' '.join(status_cases)} END,
+                last_status_change = CASE id {' '.join(time_cases)} END
+            WHERE id IN ({','.join(['%s'] * len(user_ids))})
+        """, tuple(case_vals + time_vals + user_ids))
+        conn.commit()
+    _user_cache.invalidate(*user_ids)
+    return event_ids
+
+
+_UNNOTIFIED_SELECT = """
+    SELECT ae.id, ae.user_id, u.username, u.email, u.name, u.department,
+           ae.event_type, ae.occurred_at, ae.active_duration_seconds
+    FROM activity_events ae
+    JOIN users u ON u.id = ae.user_id
+    WHERE ae.event_type='inactive' AND ae.notified=0
+"""
+
+
+def fetch_unnotified_inactive_events(limit=None):
+    q = _UNNOTIFIED_SELECT + " ORDER BY ae.occurred_at DESC"
+    params = ()
+    if limit is not None:
+        q += " LIMIT %s"
+        params = (limit,)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(q, params)
+        rows = cur.fetchall()
     return rows
 
 
 def mark_event_notified(event_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE activity_events SET notified=1 WHERE id=%s", (event_id,))
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE activity_events SET notified=1 WHERE id=%s", (event_id,))
+
+
+def mark_events_notified(event_ids):
+    if not event_ids:
+        return
+    placeholders = ",".join(["%s"] * len(event_ids))
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE activity_events SET notified=1 WHERE id IN ({placeholders})", tuple(event_ids))
+
+
+def claim_inactive_events(limit=200, lease=600):
+    """
+    Claims up to `limit` unnotified inactive events, oldest first, for `lease` seconds.
+    The row locks (SKIP LOCKED, so concurrent workers get disjoint batches) are held
+    only while the claim token is written; the caller then sends without holding
+    locks or a connection and ends the claim with finish_/release_inactive_claim. A
+    claim whose worker died is picked up again once the lease runs out.
+    Returns (token, rows); rows carry notify_attempts, counting this claim.
+    """
+    token = uuid.uuid4().hex
+    with get_connection() as conn, conn.cursor() as cur:
+        conn.begin()
+        cur.execute("""
+            SELECT ae.id, ae.user_id, u.username, u.email, u.name, u.department,
+                   ae.event_type, ae.occurred_at, ae.active_duration_seconds, ae.notify_attempts
+            FROM activity_events ae
+            JOIN users u ON u.id = ae.user_id
+            WHERE ae.event_type='inactive' AND ae.notified=0
+              AND (ae.notify_claim IS NULL OR ae.notify_claimed_at < NOW() - INTERVAL %s SECOND)
+            ORDER BY ae.occurred_at
+            LIMIT %s
+            FOR UPDATE OF ae SKIP LOCKED
+        """, (lease, limit))
+        rows = cur.fetchall()
+        if rows:
+            placeholders = ",".join(["%s"] * len(rows))
+            cur.execute(f"""
+                UPDATE activity_events
+                SET notify_claim=%s, notify_claimed_at=NOW(), notify_attempts=notify_attempts+1
+                WHERE id IN ({placeholders})
+            """, (token,) + tuple(r["id"] for r in rows))
+            for r in rows:
+                r["notify_attempts"] += 1
+        conn.commit()
+    return token, rows
+
+
+def finish_inactive_claim(token, event_ids):
+    """Mark claimed events notified. Rows whose lease was taken over are left alone."""
+    _end_inactive_claim(token, event_ids, "notified=1, ")
+
+
+def release_inactive_claim(token, event_ids):
+    """Give claimed events back for the next poll."""
+    _end_inactive_claim(token, event_ids, "")
+
+
+def _end_inactive_claim(token, event_ids, notified_sql):
+    if not event_ids:
+        return
+    placeholders = ",".join(["%s"] * len(event_ids))
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            UPDATE activity_events SET {notified_sql}notify_claim=NULL, notify_claimed_at=NULL
+            WHERE id IN ({placeholders}) AND notify_claim=%s
+        """, tuple(event_ids) + (token,))
+
+
+def _day_range(start_date, end_date):
+    """Inclusive calendar days -> half-open [start, end) datetimes, so indexes stay usable."""
+    start = dt.datetime.combine(dt.date.fromisoformat(str(start_date)[:10]), dt.time())
+    end = dt.datetime.combine(dt.date.fromisoformat(str(end_date)[:10]), dt.time())
+    return start, end + dt.timedelta(days=1)
+
+
+def _encode_cursor(occurred_at, row_id) -> str:
+    raw = f"{occurred_at.isoformat(sep=' ')}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        stamp, row_id = raw.rsplit("|", 1)
+        return dt.datetime.fromisoformat(stamp), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid pagination cursor") from e
 
 
 def fetch_user_inactive_history(user_id, start_date=None, end_date=None, limit=500):
@@ -286,9 +673,22 @@ def fetch_user_inactive_history(user_id, start_date=None, end_date=None, limit=5
     - 'inactive' rows carry the length of the *active* streak that just ended.
     - 'active'   rows carry the length of the *inactive* streak that just ended.
     This allows the UI to sum true Active vs Inactive durations correctly.
+    For paging past `limit` use fetch_user_activity_page.
+    """
+    start = end = None
+    if start_date and end_date:
+        start, end = _day_range(start_date, end_date)
+    return fetch_user_activity_page(user_id, start, end, page_size=limit)["rows"]
+
+
+def fetch_user_activity_page(user_id, start=None, end=None, cursor=None, page_size=100):
+    """
+    One page of a user's 'inactive'/'active' events, newest first, keyset-paginated
+    on (occurred_at, id) so every page costs the same regardless of depth.
+    - start/end: optional half-open [start, end) datetimes
+    - cursor:    the previous page's next_cursor
+    Returns {"rows": [...], "next_cursor": str or None}.
     """
-    conn = get_connection()
-    cur = conn.cursor()
     base = """
         SELECT ae.id, u.username, u.email, ae.event_type, ae.occurred_at, ae.notified,
                ae.active_duration_seconds
@@ -298,134 +698,353 @@ def fetch_user_inactive_history(user_id, start_date=None, end_date=None, limit=5
           AND ae.event_type IN ('inactive','active')
     """
     params = [user_id]
+    if start is not None:
+        base += " AND ae.occurred_at >= %s"
+        params.append(start)
+    if end is not None:
+        base += " AND ae.occurred_at < %s"
+        params.append(end)
+    if cursor:
+        after_ts, after_id = _decode_cursor(cursor)
+        base += " AND (ae.occurred_at < %s OR (ae.occurred_at = %s AND ae.id < %s))"
+        params += [after_ts, after_ts, after_id]
+    base += " ORDER BY ae.occurred_at DESC, ae.id DESC LIMIT %s"
+    params.append(page_size + 1)
+
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(base, tuple(params))
+        rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = _encode_cursor(last["occurred_at"], last["id"])
+    return {"rows": rows, "next_cursor": next_cursor}
+
+
+# Daily activity rollup
+#   user_daily_activity keeps per-user, per-day totals so dashboards never sum raw events.
+#   'inactive' events add to active_seconds (the active streak that ended) and
+#   'active' events add to inactive_seconds, mirroring fetch_user_inactive_history.
+#   Rows outlive activity_events retention on purpose.
+
+_ROLLUP_SELECT = """
+    SELECT user_id, DATE(occurred_at) AS activity_date,
+           COALESCE(SUM(CASE WHEN event_type='inactive' THEN active_duration_seconds END), 0),
+           COALESCE(SUM(CASE WHEN event_type='active' THEN active_duration_seconds END), 0),
+           COUNT(*)
+    FROM activity_events
+    WHERE {where}
+    GROUP BY user_id, DATE(occurred_at)
+"""
+
+
+def _rollup_events(cur, where, params):
+    """Fold the activity_events matching `where` into user_daily_activity (same transaction)."""
+    cur.execute("""
+        INSERT INTO user_daily_activity
+          (user_id, activity_date, active_seconds, inactive_seconds, transitions)
+    """ + _ROLLUP_SELECT.format(where=where) + """
+        ON DUPLICATE KEY UPDATE
+          active_seconds = active_seconds + VALUES(active_seconds),
+          inactive_seconds = inactive_seconds + VALUES(inactive_seconds),
+          transitions = transitions + VALUES(transitions)
+    """, params)
+
+
+def rebuild_daily_activity(start_date, end_date, user_id=None):
+    """Recompute the rollup for the inclusive day range from activity_events."""
+    start, end = _day_range(start_date, end_date)
+    where = "occurred_at >= %s AND occurred_at < %s"
+    params = [start, end]
+    del_where = "activity_date >= %s AND activity_date < %s"
+    del_params = [start.date(), end.date()]
+    if user_id is not None:
+        where += " AND user_id = %s"
+        params.append(user_id)
+        del_where += " AND user_id = %s"
+        del_params.append(user_id)
+    with get_connection() as conn, conn.cursor() as cur:
+        conn.begin()
+        cur.execute(f"DELETE FROM user_daily_activity WHERE {del_where}", tuple(del_params))
+        cur.execute("""
+            INSERT INTO user_daily_activity
+              (user_id, activity_date, active_seconds, inactive_seconds, transitions)
+        """ + _ROLLUP_SELECT.format(where=where), tuple(params))
+        conn.commit()
+
+
+def _rollup_filter(user_id, start_date, end_date):
+    clauses, vals = [], []
+    if user_id is not None:
+        clauses.append("user_id = %s")
+        vals.append(user_id)
     if start_date and end_date:
-        base += " AND DATE(ae.occurred_at) BETWEEN %s AND %s"
-        params += [start_date, end_date]
-    base += " ORDER BY ae.occurred_at DESC LIMIT %s"
-    params.append(limit)
-
-    cur.execute(base, tuple(params))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+        clauses.append("activity_date BETWEEN %s AND %s")
+        vals += [start_date, end_date]
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", tuple(vals)
+
+
+def fetch_activity_totals(user_id=None, start_date=None, end_date=None):
+    """
+    Active/inactive seconds and transition count for one user (or everyone when
+    user_id is None) over an inclusive day range, read from the rollup.
+    """
+    where, vals = _rollup_filter(user_id, start_date, end_date)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+          SELECT COALESCE(SUM(active_seconds),0) AS active_seconds,
+                 COALESCE(SUM(inactive_seconds),0) AS inactive_seconds,
+                 COALESCE(SUM(transitions),0) AS transitions
+          FROM user_daily_activity{where}
+        """, vals)
+        row = cur.fetchone() or {}
+    return {k: int(row.get(k) or 0) for k in ("active_seconds", "inactive_seconds", "transitions")}
+
+
+def fetch_daily_activity(user_id, start_date=None, end_date=None):
+    """Per-day rollup rows for a user, oldest first."""
+    where, vals = _rollup_filter(user_id, start_date, end_date)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+          SELECT activity_date, active_seconds, inactive_seconds, transitions
+          FROM user_daily_activity{where}
+          ORDER BY activity_date
+        """, vals)
+        rows = cur.fetchall()
     return rows
 
 # Overtime
 
 
 def insert_overtime(user_id, ot_date, seconds):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-      INSERT INTO user_overtimes (user_id, ot_date, overtime_seconds)
-      VALUES (%s,%s,%s)
-      ON DUPLICATE KEY UPDATE overtime_seconds=overtime_seconds+VALUES(overtime_seconds)
-    """, (user_id, ot_date, seconds))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+          INSERT INTO user_overtimes (user_id, ot_date, overtime_seconds)
+          VALUES (%s,%s,%s)
+          ON DUPLICATE KEY UPDATE overtime_seconds=overtime_seconds+VALUES(overtime_seconds)
+        """, (user_id, ot_date, seconds))
+        conn.commit()
+
+
+def fetch_user_shifts(user_id=None):
+    """id, shift start (seconds after midnight) and shift length for every user."""
+    q = """
+        SELECT id, TIME_TO_SEC(shift_start_time) AS shift_start,
+               TIME_TO_SEC(shift_end_time) AS shift_end, shift_duration_seconds
+        FROM users
+    """
+    params = ()
+    if user_id is not None:
+        q += " WHERE id=%s"
+        params = (user_id,)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(q, params)
+        rows = cur.fetchall()
+    return rows
+
+
+def replace_overtime(rows, start_date, end_date, user_id=None, batch_size=1000):
+    """
+    Replace user_overtimes for [start_date, end_date] (inclusive) with `rows`
+    [(user_id, ot_date, seconds)] in one transaction; days not in `rows` are cleared.
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        conn.begin()
+        if user_id is None:
+            cur.execute("DELETE FROM user_overtimes WHERE ot_date BETWEEN %s AND %s",
+                        (start_date, end_date))
+        else:
+            cur.execute(
+                "DELETE FROM user_overtimes WHERE user_id=%s AND ot_date BETWEEN %s AND %s",
+                (user_id, start_date, end_date))
+        for i in range(0, len(rows), batch_size):
+            cur.executemany("""
+              INSERT INTO user_overtimes (user_id, ot_date, overtime_seconds)
+              VALUES (%s,%s,%s)
+              ON DUPLICATE KEY UPDATE overtime_seconds=VALUES(overtime_seconds)
+            """, rows[i:i + batch_size])
+        conn.commit()
 
 
 def fetch_overtime_sum(user_id, start_date=None, end_date=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    if start_date and end_date:
-        cur.execute("""
-          SELECT COALESCE(SUM(overtime_seconds),0) AS total
-          FROM user_overtimes
-          WHERE user_id=%s AND ot_date BETWEEN %s AND %s
-        """, (user_id, start_date, end_date))
-    else:
-        cur.execute("""
-          SELECT COALESCE(SUM(overtime_seconds),0) AS total
-          FROM user_overtimes
-          WHERE user_id=%s
-        """, (user_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        if start_date and end_date:
+            cur.execute("""
+              SELECT COALESCE(SUM(overtime_seconds),0) AS total
+              FROM user_overtimes
+              WHERE user_id=%s AND ot_date BETWEEN %s AND %s
+            """, (user_id, start_date, end_date))
+        else:
+            cur.execute("""
+              SELECT COALESCE(SUM(overtime_seconds),0) AS total
+              FROM user_overtimes
+              WHERE user_id=%s
+            """, (user_id,))
+        row = cur.fetchone()
     return int(row["total"] if row and row.get("total") is not None else 0)
 
+
+# Reports
+
+USER_REPORT_SQL = """
+    SELECT u.id AS user_id, u.username, u.name, u.department,
+           COALESCE(a.active_seconds, 0) AS active_seconds,
+           COALESCE(a.inactive_seconds, 0) AS inactive_seconds,
+           COALESCE(o.overtime_seconds, 0) AS overtime_seconds,
+           COALESCE(s.screenshots, 0) AS screenshots
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, SUM(active_seconds) AS active_seconds,
+               SUM(inactive_seconds) AS inactive_seconds
+        FROM user_daily_activity
+        WHERE activity_date BETWEEN %s AND %s
+        GROUP BY user_id
+    ) a ON a.user_id = u.id
+    LEFT JOIN (
+        SELECT user_id, SUM(overtime_seconds) AS overtime_seconds
+        FROM user_overtimes
+        WHERE ot_date BETWEEN %s AND %s
+        GROUP BY user_id
+    ) o ON o.user_id = u.id
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS screenshots
+        FROM screenshots
+        WHERE taken_at >= %s AND taken_at < %s
+        GROUP BY user_id
+    ) s ON s.user_id = u.id
+    WHERE u.role <> 'admin'
+"""
+
+
+def user_report_query(start_date, end_date, department=None):
+    """(sql, params) for per-user totals over an inclusive day range; see backend.reports."""
+    start, end = _day_range(start_date, end_date)
+    sql = USER_REPORT_SQL
+    params = [start_date, end_date, start_date, end_date, start, end]
+    if department:
+        sql += " AND u.department = %s"
+        params.append(department)
+    return sql + " ORDER BY u.department, u.id", tuple(params)
+
+
+# Live feed
+#   backend.events tails these tables by primary key, so every process sees every
+#   writer's rows. Each row carries its user's department for dashboard filters.
+
+FEED_SQL = {
+    "activity_events": """
+        SELECT t.id, t.user_id, u.department, t.event_type, t.active_duration_seconds,
+               t.occurred_at
+        FROM activity_events t JOIN users u ON u.id = t.user_id""",
+    "screenshots": """
+        SELECT t.id, t.user_id, u.department, t.url, t.thumb_url, t.taken_at
+        FROM screenshots t JOIN users u ON u.id = t.user_id""",
+    "screen_recordings": """
+        SELECT t.id, t.user_id, u.department, t.url, t.duration_seconds, t.recorded_at
+        FROM screen_recordings t JOIN users u ON u.id = t.user_id""",
+}
+
+
+def fetch_feed_heads() -> dict:
+    """Highest id per feed table (0 when empty)."""
+    with get_connection() as conn, conn.cursor() as cur:
+        heads = {}
+        for table in FEED_SQL:
+            cur.execute(f"SELECT COALESCE(MAX(id), 0) AS id FROM {table}")
+            heads[table] = int(cur.fetchone()["id"])
+    return heads
+
+
+def fetch_feed_rows(table, after_id, upto_id=None, ids=None, limit=1000):
+    """
+    Rows of a feed table with id > after_id (and <= upto_id), oldest first.
+    With `ids`, just those rows instead (re-checking ids skipped by an open transaction).
+    """
+    if ids:
+        where, params = f"t.id IN ({','.join(['%s'] * len(ids))})", list(ids)
+    else:
+        where, params = "t.id > %s", [after_id]
+        if upto_id is not None:
+            where += " AND t.id <= %s"
+            params.append(upto_id)
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"{FEED_SQL[table]} WHERE {where} ORDER BY t.id LIMIT %s",
+                    tuple(params + [limit]))
+        return cur.fetchall()
+
 # Media (screenshots/recordings) ... (unchanged below)
 
 
 def insert_screenshot_url(user_id, image_bytes, event_id=None, mime="image/png"):
-    _ensure_media_dirs()
-    name = f"{_now_stamp()}_{uuid.uuid4().hex}.png"
-    relpath = os.path.join("screenshots", name)
-    abspath = os.path.join(MEDIA_ROOT, relpath)
-    with open(abspath, "wb") as f:
-        f.write(image_bytes)
-    url = f"{MEDIA_BASE_URL}/{relpath.replace(os.sep, '/')}"
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO screenshots (user_id, event_id, url, mime)
-        VALUES (%s,%s,%s,%s)
-    """, (user_id, event_id, url, mime))
-    sid = cur.lastrowid
-    cur.close()
-    conn.close()
+    """
+    image_bytes may be bytes, a binary file-like object or an iterable of chunks;
+    it is streamed to disk and atomically in place before the row is inserted.
+    With Pillow installed the row is then queued for WebP transcoding and a
+    thumbnail (backend.thumbnails); url and thumb_url are updated when that finishes.
+    """
+    _, url = media_store.store_stream("screenshots", image_bytes, ".png")
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO screenshots (user_id, event_id, url, mime)
+                VALUES (%s,%s,%s,%s)
+            """, (user_id, event_id, url, mime))
+            sid = cur.lastrowid
+    except Exception:
+        media_store.release_urls([url])
+        raise
+    try:
+        thumbnails.submit(sid, url)
+    except Exception as e:
+        # The row is committed; `python -m backend.thumbnails` picks it up later.
+        print(f"[Models] thumbnail job for screenshot {sid} not queued: {e}")
     return sid, url
 
 
 def insert_recording_url(user_id, video_bytes, duration_seconds, event_id=None, mime="video/mp4"):
-    _ensure_media_dirs()
-    name = f"{_now_stamp()}_{uuid.uuid4().hex}.mp4"
-    relpath = os.path.join("recordings", name)
-    abspath = os.path.join(MEDIA_ROOT, relpath)
-    with open(abspath, "wb") as f:
-        f.write(video_bytes)
-    url = f"{MEDIA_BASE_URL}/{relpath.replace(os.sep, '/')}"
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO screen_recordings (user_id, event_id, duration_seconds, url, mime)
-        VALUES (%s,%s,%s,%s,%s)
-    """, (user_id, event_id, duration_seconds, url, mime))
-    rid = cur.lastrowid
-    cur.close()
-    conn.close()
+    """Same streaming contract as insert_screenshot_url; pass an open file for large videos."""
+    _, url = media_store.store_stream("recordings", video_bytes, ".mp4")
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO screen_recordings (user_id, event_id, duration_seconds, url, mime)
+                VALUES (%s,%s,%s,%s,%s)
+            """, (user_id, event_id, duration_seconds, url, mime))
+            rid = cur.lastrowid
+    except Exception:
+        media_store.release_urls([url])
+        raise
     return rid, url
 
 
 def fetch_screenshots_for_user(user_id, limit=50):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-      SELECT id, user_id, event_id, taken_at, mime, url
-      FROM screenshots WHERE user_id=%s ORDER BY taken_at DESC LIMIT %s
-    """, (user_id, limit))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+          SELECT id, user_id, event_id, taken_at, mime, url, thumb_url
+          FROM screenshots WHERE user_id=%s ORDER BY taken_at DESC LIMIT %s
+        """, (user_id, limit))
+        rows = cur.fetchall()
     return rows
 
 
 def fetch_recordings_for_user(user_id, limit=20):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-      SELECT id, user_id, event_id, recorded_at, duration_seconds, mime, url
-      FROM screen_recordings WHERE user_id=%s ORDER BY recorded_at DESC LIMIT %s
-    """, (user_id, limit))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+          SELECT id, user_id, event_id, recorded_at, duration_seconds, mime, url
+          FROM screen_recordings WHERE user_id=%s ORDER BY recorded_at DESC LIMIT %s
+        """, (user_id, limit))
+        rows = cur.fetchall()
     return rows
 
 
 def list_admin_emails():
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
+    with get_connection() as conn, conn.cursor() as cur:
         cur.execute(
             "SELECT email FROM users WHERE role='admin' AND email IS NOT NULL AND email <> ''")
         rows = cur.fetchall()
-        return [(r.get("email") if isinstance(r, dict) else (r[0] if r else None)) for r in rows if r]
-    finally:
-        cur.close()
-        conn.close()
+    return [(r.get("email") if isinstance(r, dict) else (r[0] if r else None)) for r in rows if r]
 
 # ===== Avatars (NEW) =====
 
@@ -1,26 +1,237 @@
+import atexit
 import smtplib
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from email.message import EmailMessage
 from backend.config import SMTP_CONFIG
 import socket
 
+# Errors that mean the session itself is unusable; any other SMTPException is
+# per-message. SMTPException subclasses OSError, so _deliver catches the
+# per-message ones before falling back to OSError.
+_DISCONNECTS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+_CONNECTION_ERRORS = _DISCONNECTS + (socket.timeout, OSError)
+SMTP_CLOSING = 421  # the server is closing the session; smtplib has already dropped it
 
-def send_email(to_addrs, subject, body):
+
+class EmailRefused(smtplib.SMTPException):
+    """The server permanently (5xx) rejected a message; resending it won't help."""
+
+    def __init__(self, code, reason):
+        super().__init__(f"{code} {reason}")
+        self.code = code
+        self.reason = reason
+
+
+def _rejection_code(exc) -> int:
+    """SMTP reply code of a per-message rejection (lowest code over refused recipients)."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _msg in exc.recipients.values()]
+        return min(codes) if codes else 0
+    return getattr(exc, "smtp_code", 0) or 0
+
+
+class EmailSender:
     """
-    Sends email with a socket timeout.
-    If sending fails or stalls, we swallow the error so the UI never freezes.
+    Background SMTP sender.
+    Messages are queued by send() and delivered by one worker thread that keeps
+    an authenticated session open, NOOP-checks it after `noop_after` idle seconds,
+    closes it after `idle_timeout`, and reconnects with exponential backoff.
     """
-    try:
-        if isinstance(to_addrs, str):
-            to_addrs = [to_addrs]
-        msg = EmailMessage()
-        msg["From"] = SMTP_CONFIG["from_addr"]
-        msg["To"] = ", ".join(to_addrs)
-        msg["Subject"] = subject
-        msg.set_content(body)
-
-        timeout = float(SMTP_CONFIG.get("timeout", 6))
-        with smtplib.SMTP(SMTP_CONFIG["host"], SMTP_CONFIG["port"], timeout=timeout) as server:
-            if SMTP_CONFIG.get("use_tls", True):
+
+    def __init__(self, config=None, max_queue=1000, max_attempts=3,
+                 noop_after=30.0, idle_timeout=120.0, max_backoff=60.0):
+        self.config = dict(SMTP_CONFIG if config is None else config)
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.noop_after = noop_after
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._stopping = False
+        self._thread = None
+        self._smtp = None
+        self._last_used = 0.0
+        self._backoff = 0.0
+        self._stats = {
+            "queued": 0,
+            "sent": 0,
+            "failed": 0,
+            "refused": 0,
+            "dropped": 0,
+            "connects": 0,
+            "send_seconds_total": 0.0,
+            "send_seconds_last": 0.0,
+        }
+
+    # -- public API --
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="smtp-sender", daemon=True)
+                self._thread.start()
+        return self
+
+    def send(self, msg: EmailMessage) -> bool:
+        """Queue a message. Returns False if the queue is full or the sender is stopped."""
+        return self.submit(msg) is not None
+
+    def submit(self, msg: EmailMessage):
+        """
+        Queue a message and return a Future that resolves to True once it is
+        delivered or False once it is given up on, and raises EmailRefused if
+        the server rejected it permanently. None if it could not be queued.
+        """
+        fut = Future()
+        with self._cond:
+            if self._stopping or len(self._queue) >= self.max_queue:
+                self._stats["dropped"] += 1
+                return None
+            self._queue.append((msg, fut))
+            self._stats["queued"] += 1
+            self._cond.notify_all()
+        self.start()
+        return fut
+
+    def flush(self, timeout=None) -> bool:
+        """Wait until everything queued so far has been attempted."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=10.0):
+        """Deliver what is queued (up to `timeout`), then close the session."""
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out["queue_depth"] = len(self._queue) + (1 if self._busy else 0)
+            out["connected"] = self._smtp is not None
+        out["send_seconds_avg"] = (
+            out["send_seconds_total"] / out["sent"] if out["sent"] else 0.0)
+        return out
+
+    # -- worker --
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    idle = time.monotonic() - self._last_used
+                    if self._smtp is not None and idle >= self.idle_timeout:
+                        break
+                    wait = self.idle_timeout - idle if self._smtp is not None else None
+                    self._cond.wait(wait)
+                if not self._queue:
+                    if self._stopping:
+                        self._disconnect()
+                        return
+                    self._disconnect()  # idle too long; reconnect on next message
+                    continue
+                msg, fut = self._queue.popleft()
+                self._busy = True
+            delivered = False
+            try:
+                delivered = self._deliver(msg)
+            except EmailRefused as e:
+                fut.set_exception(e)
+            finally:
+                if not fut.done():
+                    fut.set_result(delivered)
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _deliver(self, msg) -> bool:
+        for _attempt in range(self.max_attempts):
+            if self._backoff and not self._sleep(self._backoff):
+                break
+            started = time.monotonic()
+            try:
+                self._session().send_message(msg)
+            except _DISCONNECTS:
+                self._reconnect_later()
+                continue
+            except smtplib.SMTPException as e:
+                code = _rejection_code(e)
+                if code == SMTP_CLOSING:
+                    self._reconnect_later()
+                    continue
+                # Rejected sender/recipient/data: the session is fine, the message is not.
+                self._last_used = time.monotonic()
+                with self._cond:
+                    self._stats["failed"] += 1
+                    if code >= 500:
+                        self._stats["refused"] += 1
+                if code >= 500:
+                    raise EmailRefused(code, e)
+                return False
+            except (socket.timeout, OSError):
+                self._reconnect_later()
+                continue
+            elapsed = time.monotonic() - started
+            self._backoff = 0.0
+            self._last_used = time.monotonic()
+            with self._cond:
+                self._stats["sent"] += 1
+                self._stats["send_seconds_total"] += elapsed
+                self._stats["send_seconds_last"] = elapsed
+            return True
+        with self._cond:
+            self._stats["failed"] += 1
+        return False
+
+    def _reconnect_later(self):
+        self._disconnect()
+        self._backoff = min(self.max_backoff, (self._backoff or 0.5) * 2)
+
+    def _sleep(self, seconds) -> bool:
+        """Back off without busy-looping; returns False if stop() was called meanwhile."""
+        deadline = time.monotonic() + seconds
+        with self._cond:
+            while not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._cond.wait(remaining)
+        return False
+
+    def _session(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.noop_after:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self._disconnect()
+            except _CONNECTION_ERRORS + (smtplib.SMTPException,):
+                self._disconnect()
+        if self._smtp is None:
+            self._smtp = self._connect()
+            self._last_used = time.monotonic()
+        return self._smtp
+
+    def _connect(self):
+        cfg = self.config
+        timeout = float(cfg.get("timeout", 6))
+        server = smtplib.SMTP(cfg["host"], cfg["port"], timeout=timeout)
+        try:
+            if cfg.get("use_tls", True):
                 try:
                     server.ehlo()
                 except Exception:
@@ -30,7 +241,75 @@ def send_email(to_addrs, subject, body):
                     server.ehlo()
                 except Exception:
                     pass
-            server.login(SMTP_CONFIG["username"], SMTP_CONFIG["password"])
-            server.send_message(msg)
-    except (socket.timeout, smtplib.SMTPException, OSError):
-        pass
+            if cfg.get("username"):
+                server.login(cfg["username"], cfg["password"])
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+            raise
+        with self._cond:
+            self._stats["connects"] += 1
+        return server
+
+    def _disconnect(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender() -> EmailSender:
+    global _sender
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                _sender = EmailSender()
+                atexit.register(_sender.stop)
+    return _sender
+
+
+def _build_message(to_addrs, subject, body) -> EmailMessage:
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+    msg = EmailMessage()
+    msg["From"] = SMTP_CONFIG["from_addr"]
+    msg["To"] = ", ".join(to_addrs)
+    msg["Subject"] = subject
+    msg.set_content(body)
+    return msg
+
+
+def send_email(to_addrs, subject, body):
+    """
+    Queues an email for the background sender and returns immediately.
+    Returns False when the message could not be queued; delivery errors are
+    counted in get_sender().stats() so the UI never freezes.
+    """
+    return get_sender().send(_build_message(to_addrs, subject, body))
+
+
+def deliver_email(to_addrs, subject, body, timeout=None) -> bool:
+    """
+    Like send_email, but waits for the outcome. True only once the SMTP server
+    accepted the message; False if it was dropped, timed out or failed in a way
+    that may succeed later. Raises EmailRefused on a permanent (5xx) rejection.
+    """
+    fut = get_sender().submit(_build_message(to_addrs, subject, body))
+    if fut is None:
+        return False
+    try:
+        return fut.result(timeout)
+    except FutureTimeout:
+        return False
@@ -0,0 +1,176 @@
+# backend/overtime.py
+"""
+Batch overtime engine.
+
+Recomputes user_overtimes for a date range from activity_events instead of
+trusting per-client insert_overtime calls:
+
+- every 'inactive' event at time t closes an active streak of
+  active_duration_seconds, i.e. the user worked [t - duration, t);
+- worked intervals are split at midnight and clipped to the range, so each
+  piece belongs to one calendar day;
+- a user's shift is the daily window [shift_start, shift_start + duration);
+  overnight shifts (end <= start) simply run past midnight, as in
+  auth._duration_seconds;
+- overtime of a piece is its length minus its overlap with the shift windows.
+
+The overlap uses the cumulative shift function
+    W(x) = floor((x - S) / day) * D + clip((x - S) mod day, 0, D)
+(seconds of shift time before x), so overlap([s, e)) = W(e) - W(s) for all
+pieces at once. Events are streamed from a server-side cursor into NumPy
+arrays; the per user-day sums are replaced in bulk.
+
+    python -m backend.overtime --start 2025-01-01 --end 2025-01-31
+"""
+import argparse
+import datetime as dt
+
+import numpy as np
+
+from backend.db import iter_query
+from backend.models import fetch_user_shifts, replace_overtime
+
+DAY = 86400
+CHUNK_ROWS = 100_000
+MAX_STREAK = DAY  # events up to this long after the range can still reach into it
+
+
+def _epoch(value) -> int:
+    """Naive local datetime/date -> seconds on a local-midnight-aligned clock."""
+    if isinstance(value, dt.datetime):
+        return int((value - dt.datetime(1970, 1, 1)).total_seconds())
+    return (value - dt.date(1970, 1, 1)).days * DAY
+
+
+def _load_intervals(start_s, end_s, user_id=None):
+    """(user_ids, starts, ends) int64 arrays of worked intervals touching [start_s, end_s)."""
+    sql = """
+        SELECT user_id, occurred_at, active_duration_seconds
+        FROM activity_events
+        WHERE event_type='inactive' AND active_duration_seconds > 0
+          AND occurred_at >= %s AND occurred_at < %s
+    """
+    params = [dt.datetime(1970, 1, 1) + dt.timedelta(seconds=start_s),
+              dt.datetime(1970, 1, 1) + dt.timedelta(seconds=end_s + MAX_STREAK)]
+    if user_id is not None:
+        sql += " AND user_id=%s"
+        params.append(user_id)
+
+    users, ends, durations = [], [], []
+    parts = []
+
+    def spill():
+        if users:
+            parts.append((np.array(users, dtype=np.int64),
+                          np.array(ends, dtype=np.int64),
+                          np.array(durations, dtype=np.int64)))
+            users.clear()
+            ends.clear()
+            durations.clear()
+
+    for row in iter_query(sql, tuple(params)):
+        users.append(row["user_id"])
+        ends.append(_epoch(row["occurred_at"]))
+        durations.append(row["active_duration_seconds"])
+        if len(users) >= CHUNK_ROWS:
+            spill()
+    spill()
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    uid = np.concatenate([p[0] for p in parts])
+    end = np.concatenate([p[1] for p in parts])
+    start = end - np.concatenate([p[2] for p in parts])
+    # Clip to the range; pieces that fall entirely outside vanish.
+    start = np.maximum(start, start_s)
+    end = np.minimum(end, end_s)
+    keep = end > start
+    return uid[keep], start[keep], end[keep]
+
+
+def _split_at_midnight(uid, start, end):
+    """Split intervals so none crosses a day boundary."""
+    out_u, out_s, out_e = [], [], []
+    while uid.size:
+        midnight = (start // DAY + 1) * DAY
+        cut = end > midnight
+        out_u += [uid[~cut], uid[cut]]
+        out_s += [start[~cut], start[cut]]
+        out_e += [end[~cut], midnight[cut]]
+        uid, start, end = uid[cut], midnight[cut], end[cut]
+    if not out_u:
+        return uid, start, end
+    return np.concatenate(out_u), np.concatenate(out_s), np.concatenate(out_e)
+
+
+def _shift_table(user_id=None):
+    """Sorted user ids with their shift start offset and length (seconds)."""
+    rows = fetch_user_shifts(user_id)
+    ids = np.array([r["id"] for r in rows], dtype=np.int64)
+    s = np.array([int(r["shift_start"] or 0) for r in rows], dtype=np.int64)
+    e = np.array([int(r["shift_end"] or 0) for r in rows], dtype=np.int64)
+    d = np.array([int(r["shift_duration_seconds"] or 0) for r in rows], dtype=np.int64)
+    # Fall back to start/end like auth._duration_seconds (end <= start rolls over).
+    derived = (e - s) % DAY
+    derived[derived == 0] = DAY
+    d = np.where(d > 0, np.minimum(d, DAY), derived)
+    order = np.argsort(ids)
+    return ids[order], s[order], d[order]
+
+
+def _shift_seconds_before(x, shift_start, shift_len):
+    """W(x): shift seconds from the epoch to x, per element."""
+    y = x - shift_start
+    return (y // DAY) * shift_len + np.clip(y % DAY, 0, shift_len)
+
+
+def compute_overtime(start_date, end_date, user_id=None):
+    """
+    Overtime per user-day for [start_date, end_date] (inclusive).
+    Returns [(user_id, date, seconds)] for days with overtime > 0.
+    """
+    start_s = _epoch(start_date)
+    end_s = _epoch(end_date) + DAY
+    uid, start, end = _load_intervals(start_s, end_s, user_id)
+    uid, start, end = _split_at_midnight(uid, start, end)
+    if not uid.size:
+        return []
+
+    ids, shift_start, shift_len = _shift_table(user_id)
+    if not ids.size:
+        return []
+    idx = np.searchsorted(ids, uid)
+    known = (idx < ids.size) & (ids[np.minimum(idx, ids.size - 1)] == uid)
+    idx, start, end = idx[known], start[known], end[known]
+    s, d = shift_start[idx], shift_len[idx]
+
+    in_shift = _shift_seconds_before(end, s, d) - _shift_seconds_before(start, s, d)
+    overtime = (end - start) - in_shift
+
+    ndays = (end_s - start_s) // DAY
+    day = (start - start_s) // DAY
+    totals = np.bincount(idx * ndays + day, weights=overtime, minlength=ids.size * ndays)
+    cells = np.flatnonzero(totals > 0)
+    first = start_date if not isinstance(start_date, dt.datetime) else start_date.date()
+    return [(int(ids[c // ndays]), first + dt.timedelta(days=int(c % ndays)), int(totals[c]))
+            for c in cells]
+
+
+def recompute_overtime(start_date, end_date, user_id=None, dry_run=False) -> int:
+    """Compute and replace user_overtimes for the range. Returns user-days with overtime."""
+    rows = compute_overtime(start_date, end_date, user_id)
+    if not dry_run:
+        replace_overtime(rows, start_date, end_date, user_id)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Recompute user_overtimes from activity_events")
+    ap.add_argument("--start", required=True, type=dt.date.fromisoformat, help="First day (YYYY-MM-DD)")
+    ap.add_argument("--end", required=True, type=dt.date.fromisoformat, help="Last day, inclusive")
+    ap.add_argument("--user-id", type=int, default=None, help="Only this user")
+    ap.add_argument("--dry-run", action="store_true", help="Compute without writing")
+    args = ap.parse_args()
+    n = recompute_overtime(args.start, args.end, args.user_id, args.dry_run)
+    verb = "would write" if args.dry_run else "wrote"
+    print(f"[Overtime] {verb} {n} user-days with overtime")
@@ -0,0 +1,190 @@
+# backend/partitions.py
+"""
+Optional RANGE partitioning of the time-series tables.
+
+activity_events, screenshots and screen_recordings can be partitioned by month
+(or day) on their timestamp column. Retention then drops whole expired
+partitions instead of deleting rows, and maintain() keeps a few future
+partitions ready ahead of time.
+
+MySQL restrictions that come with it:
+- partitioned InnoDB tables cannot have foreign keys, so enable() drops the
+  FKs on and to the table; admin_delete_user deletes child rows explicitly;
+- the primary key must contain the partition column, so it becomes (id, ts).
+"""
+import argparse
+import datetime as dt
+
+from backend.db import get_connection
+
+TS_COLUMNS = {
+    "activity_events": "occurred_at",
+    "screenshots": "taken_at",
+    "screen_recordings": "recorded_at",
+}
+DEFAULT_AHEAD = 3  # future partitions kept ready
+MAXVALUE_PARTITION = "pmax"
+
+
+def _ts_col(table):
+    if table not in TS_COLUMNS:
+        raise ValueError(f"{table} is not partitionable")
+    return TS_COLUMNS[table]
+
+
+def _period_start(day: dt.date, granularity: str) -> dt.date:
+    return day.replace(day=1) if granularity == "month" else day
+
+
+def _next_period(start: dt.date, granularity: str) -> dt.date:
+    if granularity == "day":
+        return start + dt.timedelta(days=1)
+    return (start.replace(day=28) + dt.timedelta(days=4)).replace(day=1)
+
+
+def _partition_name(start: dt.date, granularity: str) -> str:
+    return start.strftime("p%Y%m" if granularity == "month" else "p%Y%m%d")
+
+
+def _partition_sql(start: dt.date, granularity: str) -> str:
+    upper = _next_period(start, granularity)
+    return (f"PARTITION {_partition_name(start, granularity)} VALUES LESS THAN "
+            f"(UNIX_TIMESTAMP('{upper:%Y-%m-%d} 00:00:00'))")
+
+
+def list_partitions(cur, table):
+    """[(name, upper_bound_epoch or None for MAXVALUE)] in order; [] if not partitioned."""
+    cur.execute("""
+        SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    out = []
+    for r in cur.fetchall():
+        bound = r["bound"]
+        out.append((r["name"], None if bound in (None, "MAXVALUE") else int(bound)))
+    return out
+
+
+def _granularity_of(partitions):
+    for name, bound in partitions:
+        if bound is not None:
+            return "day" if len(name) == 9 else "month"
+    return "month"
+
+
+def _date_of(name: str) -> dt.date:
+    fmt = "p%Y%m%d" if len(name) == 9 else "p%Y%m"
+    return dt.datetime.strptime(name, fmt).date()
+
+
+def _drop_foreign_keys(cur, table):
+    cur.execute("""
+        SELECT TABLE_NAME AS tbl, CONSTRAINT_NAME AS name
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE()
+          AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)
+    """, (table, table))
+    for r in cur.fetchall():
+        cur.execute(f"ALTER TABLE {r['tbl']} DROP FOREIGN KEY {r['name']}")
+
+
+def enable(table, granularity="month", ahead=DEFAULT_AHEAD):
+    """Convert `table` to RANGE partitioning on its timestamp column (no-op if already done)."""
+    if granularity not in ("month", "day"):
+        raise ValueError("granularity must be 'month' or 'day'")
+    ts = _ts_col(table)
+    with get_connection() as conn, conn.cursor() as cur:
+        if list_partitions(cur, table):
+            return
+        _drop_foreign_keys(cur, table)
+        cur.execute(f"""
+            ALTER TABLE {table}
+              MODIFY {ts} TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+              DROP PRIMARY KEY,
+              ADD PRIMARY KEY (id, {ts})
+        """)
+        cur.execute(f"SELECT MIN({ts}) AS oldest FROM {table}")
+        oldest = (cur.fetchone() or {}).get("oldest") or dt.datetime.now()
+        start = _period_start(oldest.date(), granularity)
+        last = _period_start(dt.date.today(), granularity)
+        for _ in range(ahead):
+            last = _next_period(last, granularity)
+        parts = []
+        while start <= last:
+            parts.append(_partition_sql(start, granularity))
+            start = _next_period(start, granularity)
+        parts.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+        cur.execute(f"ALTER TABLE {table} PARTITION BY RANGE (UNIX_TIMESTAMP({ts})) (\n  "
+                    + ",\n  ".join(parts) + "\n)")
+
+
+def ensure_future_partitions(cur, table, ahead=DEFAULT_AHEAD) -> int:
+    """Split the MAXVALUE partition so `ahead` future periods exist. Returns partitions added."""
+    partitions = list_partitions(cur, table)
+    bounded = [p for p in partitions if p[1] is not None]
+    if not bounded:
+        return 0
+    granularity = _granularity_of(partitions)
+    target = _period_start(dt.date.today(), granularity)
+    for _ in range(ahead):
+        target = _next_period(target, granularity)
+    start = _next_period(_date_of(bounded[-1][0]), granularity)
+    parts = []
+    while start <= target:
+        parts.append(_partition_sql(start, granularity))
+        start = _next_period(start, granularity)
+    if not parts:
+        return 0
+    # pmax should be empty, so reorganising it is a metadata-only change in practice.
+    parts.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+    cur.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO (\n  "
+                + ",\n  ".join(parts) + "\n)")
+    return len(parts) - 1
+
+
+def expired_partitions(cur, table, cutoff: dt.datetime):
+    """Partitions whose every row is older than `cutoff` (upper bound <= cutoff)."""
+    cur.execute("SELECT UNIX_TIMESTAMP(%s) AS cutoff", (cutoff,))
+    cutoff_epoch = int(cur.fetchone()["cutoff"])
+    return [name for name, bound in list_partitions(cur, table)
+            if bound is not None and bound <= cutoff_epoch]
+
+
+def drop_partition(cur, table, name):
+    cur.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+
+
+def maintain(ahead=DEFAULT_AHEAD) -> dict:
+    """Pre-create future partitions on every partitioned table."""
+    added = {}
+    with get_connection() as conn, conn.cursor() as cur:
+        for table in TS_COLUMNS:
+            if list_partitions(cur, table):
+                added[table] = ensure_future_partitions(cur, table, ahead)
+    return added
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Partition management for time-series tables")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p_enable = sub.add_parser("enable", help="Partition a table (drops its foreign keys)")
+    p_enable.add_argument("table", choices=sorted(TS_COLUMNS))
+    p_enable.add_argument("--granularity", choices=["month", "day"], default="month")
+    p_enable.add_argument("--ahead", type=int, default=DEFAULT_AHEAD)
+    p_maint = sub.add_parser("maintain", help="Pre-create future partitions")
+    p_maint.add_argument("--ahead", type=int, default=DEFAULT_AHEAD)
+    sub.add_parser("status", help="List partitions")
+    args = ap.parse_args()
+
+    if args.command == "enable":
+        enable(args.table, args.granularity, args.ahead)
+        print(f"[{args.table}] partitioned by {args.granularity}")
+    elif args.command == "maintain":
+        print(f"[Partitions] added {maintain(args.ahead)}")
+    else:
+        with get_connection() as conn, conn.cursor() as cur:
+            for table in TS_COLUMNS:
+                names = [n for n, _b in list_partitions(cur, table)]
+                print(f"[{table}] {', '.join(names) if names else 'not partitioned'}")
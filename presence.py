@@ -0,0 +1,219 @@
+# backend/presence.py
+"""
+In-memory presence registry.
+
+Holds each user's current status, when it last changed and when the user was
+last seen. set_user_status reports every transition here (once enabled):
+
+- a transition to the status the user already has only refreshes last_seen;
+  users.status is not rewritten;
+- a real change is written through to users right away, under a per-user
+  lock, so concurrent reports for one user reach MySQL in the order they are
+  applied in memory; the entry only changes once the write succeeded;
+- with buffered ingestion the change is applied first and undone (unless a
+  later report superseded it) if its batch fails to write;
+- last_seen timestamps are collected and flushed in one UPDATE every
+  `flush_interval` seconds.
+
+snapshot() serves the whole organisation from memory; MySQL is read once, when
+the registry is seeded. Users created, edited or deleted through backend.models
+are picked up via its user listeners.
+"""
+import atexit
+import datetime as dt
+import threading
+
+from backend.models import (add_user_listener, fetch_presence_rows, get_user_by_id,
+                            remove_user_listener, update_user_status, update_last_seen)
+
+
+class PresenceRegistry:
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self._users = {}   # user_id -> presence dict
+        self._seen = {}    # user_id -> last_seen not yet written
+        self._user_locks = {}  # user_id -> Lock ordering that user's status writes
+        self._unwritten = {}  # user_id -> (status, since, previous status, previous since)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.coalesced = 0
+        self.written = 0
+        for row in fetch_presence_rows():
+            self._users[row["id"]] = self._entry(row)
+        add_user_listener(self._on_user_change)
+        self._thread = threading.Thread(target=self._run, name="presence-flush", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _entry(row):
+        return {
+            "user_id": row["id"],
+            "username": row.get("username"),
+            "name": row.get("name"),
+            "department": row.get("department"),
+            "role": row.get("role"),
+            "status": row.get("status") or "off",
+            "since": row.get("last_status_change"),
+            "last_seen": row.get("last_seen_at"),
+        }
+
+    def observe(self, user_id, status, at=None, persist=True, written=None) -> bool:
+        """
+        Record that `user_id` reported `status`. Returns True if the status changed.
+        persist=False when the caller writes users.status itself (buffered ingestion);
+        pass that write's Future as `written` to undo the change if it fails.
+        """
+        at = at or dt.datetime.now()
+        with self._user_lock(user_id):
+            with self._lock:
+                entry = self._users.get(user_id)
+            if entry is None:
+                row = get_user_by_id(user_id)
+                if row is None:
+                    raise ValueError(f"Unknown user {user_id}")
+                with self._lock:
+                    entry = self._users.setdefault(user_id, self._entry(row))
+            with self._lock:
+                entry["last_seen"] = at
+                self._seen[user_id] = at
+                if entry["status"] == status:
+                    self.coalesced += 1
+                    return False
+            if persist:
+                update_user_status(user_id, status)
+            with self._lock:
+                if persist:
+                    self.written += 1
+                    self._unwritten.pop(user_id, None)
+                elif written is not None:
+                    self._unwritten[user_id] = (status, at, entry["status"], entry["since"])
+                entry["status"] = status
+                entry["since"] = at
+        if written is not None and not persist:
+            written.add_done_callback(lambda f: self._settle(user_id, status, at, f))
+        return True
+
+    def _settle(self, user_id, status, at, written):
+        """A buffered write finished: forget its undo record, or apply it if the write failed."""
+        with self._lock:
+            undo = self._unwritten.get(user_id)
+            if undo is None or undo[:2] != (status, at):
+                return  # superseded by a later report
+            del self._unwritten[user_id]
+            entry = self._users.get(user_id)
+            if written.exception() is None or entry is None:
+                return
+            if (entry["status"], entry["since"]) == (status, at):
+                entry["status"], entry["since"] = undo[2], undo[3]
+
+    def _user_lock(self, user_id):
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = threading.Lock()
+            return lock
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            return dict(entry) if entry else None
+
+    def snapshot(self, department=None, hide_admin=True):
+        """Copies of every user's presence, optionally narrowed to one department."""
+        with self._lock:
+            return [dict(e) for e in self._users.values()
+                    if not (hide_admin and e["role"] == "admin")
+                    and (department is None or e["department"] == department)]
+
+    def forget(self, user_id):
+        """Drop a deleted user."""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._seen.pop(user_id, None)
+            self._unwritten.pop(user_id, None)
+            self._user_locks.pop(user_id, None)
+
+    def refresh(self, user_id):
+        """Re-read a user's profile (name, department, role); live status is kept."""
+        row = get_user_by_id(user_id)
+        if row is None:
+            self.forget(user_id)
+            return
+        fresh = self._entry(row)
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                self._users[user_id] = fresh
+            else:
+                for key in ("username", "name", "department", "role"):
+                    entry[key] = fresh[key]
+
+    def _on_user_change(self, user_id, deleted):
+        if deleted:
+            self.forget(user_id)
+        else:
+            self.refresh(user_id)
+
+    def flush(self):
+        """Write collected last_seen timestamps now."""
+        with self._flush_lock:
+            with self._lock:
+                seen, self._seen = self._seen, {}
+            try:
+                update_last_seen(seen)
+            except Exception:
+                with self._lock:  # keep them for the next attempt unless superseded
+                    for uid, at in seen.items():
+                        self._seen.setdefault(uid, at)
+                raise
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Presence] last_seen flush failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "pending_last_seen": len(self._seen),
+                "coalesced": self.coalesced,
+                "written": self.written,
+            }
+
+    def stop(self, timeout=None):
+        remove_user_listener(self._on_user_change)
+        self._stop.set()
+        self._thread.join(timeout)
+        self.flush()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def enable_presence(flush_interval=5.0) -> PresenceRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PresenceRegistry(flush_interval)
+    return _registry
+
+
+def get_registry():
+    """The active registry, or None when presence tracking is off."""
+    return _registry
+
+
+def disable_presence(timeout=None):
+    global _registry
+    with _registry_lock:
+        reg, _registry = _registry, None
+    if reg is not None:
+        reg.stop(timeout)
+
+
+atexit.register(disable_presence)
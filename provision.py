@@ -0,0 +1,173 @@
+# backend/provision.py
+"""
+Bulk user provisioning.
+
+    python -m backend.provision users.csv --report report.csv
+    python -m backend.provision users.jsonl --department Sales
+
+Input rows carry username, name, department, email, password and optionally
+shift_start_time / shift_end_time (HH:MM:SS). Duplicates against the database
+are found with one set-based lookup, passwords are hashed across a process
+pool (bcrypt is CPU-bound), and users are inserted with one multi-row INSERT
+per batch, their ids read back by username.
+Every input row gets a line in the report: created, duplicate or invalid.
+"""
+import os
+import csv
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.auth import hash_password, _duration_seconds
+from backend.models import find_existing_logins, insert_users
+
+REQUIRED = ("username", "name", "department", "email", "password")
+REPORT_FIELDS = ("line", "username", "email", "status", "user_id", "error")
+INSERT_BATCH = 500
+
+
+def read_records(path):
+    """
+    Yield (file line number, record) from a .csv or .jsonl file (by extension).
+    A JSONL line that does not parse yields a ValueError as its record, so it is
+    reported as invalid instead of aborting the import.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for num, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield num, json.loads(line)
+                except ValueError as e:
+                    yield num, ValueError(f"invalid JSON: {e}")
+        else:
+            reader = csv.DictReader(f)
+            for rec in reader:
+                yield reader.line_num, rec
+
+
+def _numbered(records):
+    """Accept plain records or (line, record) pairs as yielded by read_records."""
+    for i, item in enumerate(records, start=1):
+        if isinstance(item, tuple) and len(item) == 2 and isinstance(item[0], int):
+            yield item
+        else:
+            yield i, item
+
+
+def _validate(rec):
+    """Normalised user dict (password still plain), or raise ValueError."""
+    rec = {k: (str(v).strip() if v is not None else None) for k, v in rec.items() if k}
+    missing = [k for k in REQUIRED if not rec.get(k)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if "@" not in rec["email"]:
+        raise ValueError("invalid email")
+    start = rec.get("shift_start_time") or "09:00:00"
+    end = rec.get("shift_end_time") or "18:00:00"
+    duration = _duration_seconds(start, end)  # ValueError on a bad time
+    return {
+        "username": rec["username"],
+        "name": rec["name"],
+        "department": rec["department"],
+        "email": rec["email"],
+        "password": rec["password"],
+        "role": "user",
+        "shift_start_time": start,
+        "shift_end_time": end,
+        "shift_duration_seconds": duration,
+    }
+
+
+def bulk_create_users(records, workers=None, batch_size=INSERT_BATCH):
+    """
+    Create users from an iterable of dicts (or read_records pairs). Returns the
+    per-row report: [{line, username, email, status, user_id, error}] in input order.
+    """
+    report, pending = [], []
+    seen_users, seen_emails = set(), set()
+    for line, rec in _numbered(records):
+        entry = {"line": line, "username": None, "email": None,
+                 "status": "invalid", "user_id": None, "error": None}
+        report.append(entry)
+        if isinstance(rec, ValueError):
+            entry["error"] = str(rec)
+            continue
+        if not isinstance(rec, dict):
+            entry["error"] = "record is not an object"
+            continue
+        entry["username"], entry["email"] = rec.get("username"), rec.get("email")
+        try:
+            user = _validate(rec)
+        except ValueError as e:
+            entry["error"] = str(e)
+            continue
+        u, e = user["username"].lower(), user["email"].lower()
+        if u in seen_users or e in seen_emails:
+            entry["status"], entry["error"] = "duplicate", "repeated in input"
+            continue
+        seen_users.add(u)
+        seen_emails.add(e)
+        pending.append((entry, user))
+
+    taken_users, taken_emails = find_existing_logins(
+        [u["username"] for _e, u in pending], [u["email"] for _e, u in pending])
+    fresh = []
+    for entry, user in pending:
+        if user["username"].lower() in taken_users or user["email"].lower() in taken_emails:
+            entry["status"], entry["error"] = "duplicate", "username or email already exists"
+        else:
+            fresh.append((entry, user))
+    if not fresh:
+        return report
+
+    workers = workers or os.cpu_count() or 1
+    passwords = [user.pop("password") for _e, user in fresh]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunk = max(1, len(passwords) // (workers * 4))
+        for (_entry, user), pwd_hash in zip(fresh, pool.map(hash_password, passwords,
+                                                            chunksize=chunk)):
+            user["password_hash"] = pwd_hash
+
+    for (entry, _user), (user_id, error) in zip(fresh, insert_users([u for _e, u in fresh],
+                                                                    batch_size)):
+        if error:
+            entry["status"], entry["error"] = "duplicate", error
+        else:
+            entry["status"], entry["user_id"] = "created", user_id
+    return report
+
+
+def write_report(report, out):
+    writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(report)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Create many users from a CSV or JSONL file")
+    ap.add_argument("path", help="Input file (.csv or .jsonl)")
+    ap.add_argument("--report", default=None, help="Write the per-row CSV report here (default stdout)")
+    ap.add_argument("--workers", type=int, default=None, help="Password hashing processes (default CPU count)")
+    ap.add_argument("--batch-size", type=int, default=INSERT_BATCH, help="Rows per multi-row INSERT (one transaction each)")
+    ap.add_argument("--department", default=None, help="Department for rows that leave it blank")
+    args = ap.parse_args()
+
+    records = read_records(args.path)
+    if args.department:
+        records = ((n, {**r, "department": r.get("department") or args.department}
+                    if isinstance(r, dict) else r) for n, r in records)
+    result = bulk_create_users(records, args.workers, args.batch_size)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8", newline="") as f:
+            write_report(result, f)
+    else:
+        write_report(result, sys.stdout)
+    counts = {}
+    for entry in result:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    print(f"[Provision] {counts}", file=sys.stderr)
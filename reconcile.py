@@ -0,0 +1,283 @@
+# backend/reconcile.py
+"""
+Orphan media reconciler.
+
+Finds files under MEDIA_ROOT that no row references, and rows whose file is
+missing, without holding either side in memory:
+
+1. stream every media URL from screenshots (url, thumb_url), screen_recordings
+   and users.image_url into a Bloom filter;
+2. walk MEDIA_ROOT with os.scandir, building a second filter of files; a file
+   the URL filter has definitely never seen is an orphan;
+3. stream the URLs again; one the file filter has definitely never seen (and
+   that os.path.exists confirms) is a dangling row;
+4. stream media_objects; a counted object the URL filter has definitely never
+   seen is a leaked reference, which keeps its file alive forever. These are
+   only reported (an object first referenced during the run can show up too),
+   and the true count is unknown, so fixing one is left to a human.
+
+Bloom filters have no false negatives, so nothing referenced is ever reported
+as an orphan; a false positive only means an orphan is missed until next run.
+Files younger than --grace are skipped because ingestion writes the file
+before inserting its row. A content-addressed file can still gain a row after
+the scan (identical bytes are stored again), so --delete-files re-checks its
+media_objects row under FOR UPDATE and keeps it if it is referenced again.
+--fix-rows releases the media references of the rows it deletes or clears, in
+the same transaction, as retention does.
+"""
+import os
+import time
+import math
+import hashlib
+import argparse
+
+from backend import media_store
+from backend.db import get_connection, iter_query
+from backend.config import MEDIA_ROOT
+
+MEDIA_DIRS = ("screenshots", "recordings", "avatars")
+DEFAULT_GRACE = 3600  # seconds
+DEFAULT_FP_RATE = 0.001
+BATCH_SIZE = 1000
+
+# (table, id column, url column, fix applied to a dangling row, url columns the fix releases)
+URL_SOURCES = [
+    ("screenshots", "id", "url", "DELETE FROM screenshots WHERE id IN ({ids})",
+     ("url", "thumb_url")),
+    ("screenshots", "id", "thumb_url", "UPDATE screenshots SET thumb_url=NULL WHERE id IN ({ids})",
+     ("thumb_url",)),
+    ("screen_recordings", "id", "url", "DELETE FROM screen_recordings WHERE id IN ({ids})",
+     ("url",)),
+    ("users", "id", "image_url", "UPDATE users SET image_url=NULL WHERE id IN ({ids})", ()),
+]
+
+
+class BloomFilter:
+    def __init__(self, expected_items, fp_rate=DEFAULT_FP_RATE):
+        n = max(int(expected_items), 1)
+        self.size = max(8, int(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / n * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+def _iter_urls():
+    """(source, id, relpath) for every media URL in the database; source is a URL_SOURCES entry."""
+    for source in URL_SOURCES:
+        table, id_col, url_col = source[:3]
+        for row in iter_query(f"""
+            SELECT {id_col} AS id, {url_col} AS url FROM {table}
+            WHERE {url_col} IS NOT NULL AND {url_col} <> ''
+        """):
+            rel = media_store.relpath_from_url(row["url"])
+            if rel is not None:
+                yield source, row["id"], rel
+
+
+def _iter_files(root):
+    """(relpath, DirEntry) for every regular file in the media directories."""
+    stack = [os.path.join(root, d) for d in MEDIA_DIRS]
+    while stack:
+        path = stack.pop()
+        try:
+            it = os.scandir(path)
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue  # in-flight temp files
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    rel = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                    yield rel, entry
+
+
+def _count_urls() -> int:
+    total = 0
+    with get_connection() as conn, conn.cursor() as cur:
+        for table, _id, url_col, _fix, _release in URL_SOURCES:
+            cur.execute(f"SELECT COUNT(*) AS n FROM {table} WHERE {url_col} IS NOT NULL")
+            total += int(cur.fetchone()["n"])
+    return total
+
+
+def _flush_fixes(pending):
+    """
+    Apply each pending fix with its media references released in the same
+    transaction. The url columns are re-read under FOR UPDATE, so a screenshot
+    whose url and thumb_url are both dangling never has its thumb released twice.
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        for (table, id_col, _url, fix, release), ids in pending.items():
+            if not ids:
+                continue
+            placeholders = ",".join(["%s"] * len(ids))
+            conn.begin()
+            if release:
+                cur.execute(f"""
+                    SELECT {", ".join(release)} FROM {table}
+                    WHERE {id_col} IN ({placeholders}) FOR UPDATE
+                """, tuple(ids))
+                urls = [r[c] for r in cur.fetchall() for c in release if r.get(c)]
+                media_store.release_urls(urls, cur=cur)
+            cur.execute(fix.format(ids=placeholders), tuple(ids))
+            conn.commit()
+    pending.clear()
+
+
+def _delete_objects(candidates, stats):
+    """
+    Unlink orphaned content-addressed files unless a row took a reference after
+    the scan. The media_objects row (or, if it is gone, the gap) stays locked
+    until the file is unlinked, so store_stream cannot re-reference it meanwhile.
+    """
+    if not candidates:
+        return
+    rels = sorted(candidates)
+    placeholders = ",".join(["%s"] * len(rels))
+    with get_connection() as conn, conn.cursor() as cur:
+        conn.begin()
+        cur.execute(f"""
+            SELECT relpath, refcount FROM media_objects
+            WHERE relpath IN ({placeholders}) FOR UPDATE
+        """, tuple(rels))
+        referenced = {r["relpath"] for r in cur.fetchall() if r["refcount"] > 0}
+        gone = []
+        for rel in rels:
+            if rel in referenced:
+                stats["files_kept"] += 1
+                continue
+            try:
+                os.remove(media_store.abspath_for(rel))
+            except OSError:
+                continue
+            gone.append(rel)
+            stats["files_deleted"] += 1
+            stats["bytes_reclaimed"] += candidates[rel]
+        if gone:
+            cur.execute(
+                f"DELETE FROM media_objects WHERE relpath IN ({','.join(['%s'] * len(gone))})",
+                tuple(gone))
+        conn.commit()
+    candidates.clear()
+
+
+def reconcile(delete_files=False, fix_rows=False, grace=DEFAULT_GRACE,
+              fp_rate=DEFAULT_FP_RATE, expected_files=None, report=None) -> dict:
+    stats = {
+        "files_scanned": 0, "orphan_files": 0, "orphan_bytes": 0,
+        "files_deleted": 0, "files_kept": 0, "bytes_reclaimed": 0,
+        "urls_scanned": 0, "dangling_rows": 0, "rows_fixed": 0,
+        "objects_scanned": 0, "leaked_refs": 0,
+    }
+    started = time.monotonic()
+
+    referenced = BloomFilter(_count_urls(), fp_rate)
+    for _source, _id, rel in _iter_urls():
+        referenced.add(rel)
+        stats["urls_scanned"] += 1
+
+    on_disk = BloomFilter(expected_files or max(stats["urls_scanned"], 1), fp_rate)
+    now = time.time()
+    candidates = {}  # content-addressed relpath -> size, awaiting _delete_objects
+    for rel, entry in _iter_files(MEDIA_ROOT):
+        stats["files_scanned"] += 1
+        on_disk.add(rel)
+        if rel in referenced:
+            continue
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if now - st.st_mtime < grace:
+            continue
+        stats["orphan_files"] += 1
+        stats["orphan_bytes"] += st.st_size
+        if report:
+            report.write(f"orphan_file\t{rel}\t{st.st_size}\n")
+        if not delete_files:
+            continue
+        if media_store.is_content_addressed(rel):
+            candidates[rel] = st.st_size
+            if len(candidates) >= BATCH_SIZE:
+                _delete_objects(candidates, stats)
+            continue
+        try:
+            os.remove(entry.path)
+        except OSError:
+            continue
+        stats["files_deleted"] += 1
+        stats["bytes_reclaimed"] += st.st_size
+    _delete_objects(candidates, stats)
+
+    pending = {}
+    for source, row_id, rel in _iter_urls():
+        if rel in on_disk or os.path.exists(media_store.abspath_for(rel)):
+            continue
+        stats["dangling_rows"] += 1
+        if report:
+            report.write(f"dangling_row\t{source[0]}\t{row_id}\t{rel}\n")
+        if fix_rows:
+            pending.setdefault(source, []).append(row_id)
+            stats["rows_fixed"] += 1
+            if sum(len(v) for v in pending.values()) >= BATCH_SIZE:
+                _flush_fixes(pending)
+    if pending:
+        _flush_fixes(pending)
+
+    # store_stream takes the reference before the row is inserted, so skip fresh objects.
+    for row in iter_query("""
+        SELECT relpath, refcount FROM media_objects
+        WHERE refcount > 0 AND created_at < NOW() - INTERVAL %s SECOND
+    """, (grace,)):
+        stats["objects_scanned"] += 1
+        if row["relpath"] in referenced:
+            continue
+        stats["leaked_refs"] += 1
+        if report:
+            report.write(f"leaked_ref\t{row['relpath']}\t{row['refcount']}\n")
+
+    stats["seconds"] = round(time.monotonic() - started, 1)
+    stats["filter_bytes"] = referenced.nbytes + on_disk.nbytes
+    return stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Find (and optionally remove) media/DB drift")
+    ap.add_argument("--delete-files", action="store_true", help="Delete files no row references")
+    ap.add_argument("--fix-rows", action="store_true",
+                    help="Delete media rows / clear urls whose file is missing")
+    ap.add_argument("--grace", type=int, default=DEFAULT_GRACE, help="Skip files younger than this (s)")
+    ap.add_argument("--fp-rate", type=float, default=DEFAULT_FP_RATE, help="Bloom filter false-positive rate")
+    ap.add_argument("--expected-files", type=int, default=None, help="Approximate file count on disk")
+    ap.add_argument("--report", default=None, help="Write one line per finding to this TSV file")
+    args = ap.parse_args()
+
+    out = open(args.report, "w", encoding="utf-8") if args.report else None
+    try:
+        result = reconcile(args.delete_files, args.fix_rows, args.grace, args.fp_rate,
+                           args.expected_files, out)
+    finally:
+        if out:
+            out.close()
+    for k, v in result.items():
+        print(f"[Reconcile] {k}: {v}")
@@ -0,0 +1,99 @@
+# backend/reports.py
+"""
+Productivity reports per user and per department.
+
+One grouped query (models.USER_REPORT_SQL) joins the daily activity rollup,
+user_overtimes and screenshot counts per user, so MySQL returns one row per
+user whatever the range. Rows are streamed straight into column arrays;
+department totals are then aggregated in NumPy.
+
+    python -m backend.reports --start 2025-01-01 --end 2025-03-31 --out q1.parquet
+    python -m backend.reports --start 2025-01-01 --end 2025-01-31 --level user --out jan.csv
+"""
+import csv
+import argparse
+import datetime as dt
+
+import numpy as np
+
+from backend.db import iter_query
+from backend.models import user_report_query
+
+TEXT_COLUMNS = ("username", "name", "department")
+NUMERIC_COLUMNS = ("active_seconds", "inactive_seconds", "overtime_seconds", "screenshots")
+
+
+def user_report(start_date, end_date, department=None) -> dict:
+    """Column name -> NumPy array, one element per (non-admin) user."""
+    sql, params = user_report_query(start_date, end_date, department)
+    ids, text = [], {c: [] for c in TEXT_COLUMNS}
+    numbers = {c: [] for c in NUMERIC_COLUMNS}
+    for row in iter_query(sql, params):
+        ids.append(row["user_id"])
+        for c in TEXT_COLUMNS:
+            text[c].append(row[c] or "")
+        for c in NUMERIC_COLUMNS:
+            numbers[c].append(int(row[c] or 0))
+    columns = {"user_id": np.array(ids, dtype=np.int64)}
+    columns.update({c: np.array(v, dtype=object) for c, v in text.items()})
+    columns.update({c: np.array(v, dtype=np.int64) for c, v in numbers.items()})
+    return _with_ratio(columns)
+
+
+def department_report(users: dict) -> dict:
+    """Aggregate a user_report by department."""
+    departments, group = np.unique(users["department"].astype(str), return_inverse=True)
+    columns = {
+        "department": departments.astype(object),
+        "users": np.bincount(group, minlength=departments.size).astype(np.int64),
+    }
+    for c in NUMERIC_COLUMNS:
+        columns[c] = np.bincount(group, weights=users[c],
+                                 minlength=departments.size).astype(np.int64)
+    return _with_ratio(columns)
+
+
+def _with_ratio(columns):
+    tracked = columns["active_seconds"] + columns["inactive_seconds"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(tracked > 0, columns["active_seconds"] / tracked, 0.0)
+    columns["active_ratio"] = np.round(ratio, 4)
+    return columns
+
+
+def write_csv(columns: dict, path):
+    names = list(columns)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*(columns[n].tolist() for n in names)))
+
+
+def write_parquet(columns: dict, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Install pyarrow for Parquet export.")
+    table = pa.table({n: (pa.array(v.tolist(), type=pa.string()) if v.dtype == object
+                          else pa.array(v)) for n, v in columns.items()})
+    pq.write_table(table, path)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Active/inactive/overtime/screenshot report")
+    ap.add_argument("--start", required=True, type=dt.date.fromisoformat, help="First day (YYYY-MM-DD)")
+    ap.add_argument("--end", required=True, type=dt.date.fromisoformat, help="Last day, inclusive")
+    ap.add_argument("--department", default=None, help="Only this department")
+    ap.add_argument("--level", choices=["department", "user"], default="department")
+    ap.add_argument("--out", required=True, help="Output file; .parquet for Parquet, otherwise CSV")
+    args = ap.parse_args()
+
+    report = user_report(args.start, args.end, args.department)
+    if args.level == "department":
+        report = department_report(report)
+    if args.out.lower().endswith(".parquet"):
+        write_parquet(report, args.out)
+    else:
+        write_csv(report, args.out)
+    print(f"[Reports] {len(next(iter(report.values())))} {args.level} rows -> {args.out}")
@@ -0,0 +1,10 @@
+import os
+import sys
+import types
+
+# The repository root *is* the `backend` package; expose it under that name.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "backend" not in sys.modules:
+    package = types.ModuleType("backend")
+    package.__path__ = [ROOT]
+    sys.modules["backend"] = package
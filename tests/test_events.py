@@ -0,0 +1,111 @@
+import pytest
+
+from backend import events
+
+
+class FakeFeedTables:
+    """Committed rows per feed table, served the way models.fetch_feed_rows does."""
+
+    def __init__(self):
+        self.rows = {t: {} for t, _ in events.TABLES}
+
+    def commit(self, table, *ids):
+        for i in ids:
+            self.rows[table][i] = {"id": i, "user_id": 7, "department": "Ops"}
+
+    def fetch_feed_rows(self, table, after_id, upto_id=None, ids=None, limit=1000):
+        rows = self.rows[table]
+        if ids:
+            picked = [i for i in ids if i in rows]
+        else:
+            picked = [i for i in rows if i > after_id and (upto_id is None or i <= upto_id)]
+        return [dict(rows[i]) for i in sorted(picked)[:limit]]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeFeedTables()
+    monkeypatch.setattr(events, "fetch_feed_rows", fake.fetch_feed_rows)
+    return fake
+
+
+def _feed():
+    feed = events.EventFeed(buffer_size=100)
+    feed._cursor = {t: 0 for t, _ in events.TABLES}  # as _attach leaves it, without the thread
+    return feed
+
+
+def _row_ids(feed):
+    return [(e["type"], e["row_id"]) for _seq, e in feed._ring]
+
+
+def test_cursor_round_trip():
+    cursor = {"activity_events": 12, "screenshots": 0, "screen_recordings": 3}
+    assert events.format_cursor(cursor) == "12-0-3"
+    assert events.parse_cursor("12-0-3") == cursor
+
+
+@pytest.mark.parametrize("token", ["", "12-0", "1-2-3-4", "a-b-c", "1--3"])
+def test_parse_cursor_rejects_malformed_ids(token):
+    with pytest.raises(ValueError):
+        events.parse_cursor(token)
+
+
+def test_poll_advances_the_cursor_per_table(db):
+    db.commit("activity_events", 1, 2)
+    db.commit("screen_recordings", 5)
+    feed = _feed()
+    assert feed.poll() == 3
+    assert _row_ids(feed) == [("activity", 1), ("activity", 2), ("recording", 5)]
+    assert [e["id"] for _s, e in feed._ring] == ["1-0-0", "2-0-0", "2-0-5"]
+    assert feed.poll() == 0
+
+
+def test_skipped_id_is_delivered_once_its_transaction_commits(db):
+    db.commit("activity_events", 1, 2, 4)  # 3 is still in an open transaction
+    feed = _feed()
+    assert feed.poll() == 3
+    assert feed.stats()["gaps"] == 1
+    db.commit("activity_events", 3)
+    assert feed.poll() == 1
+    assert _row_ids(feed)[-1] == ("activity", 3)
+    assert feed._ring[-1][1]["id"] == "4-0-0"  # the cursor never moves backwards
+    assert feed.stats()["gaps"] == 0
+    assert feed.poll() == 0
+
+
+def test_skipped_id_is_given_up_after_the_gap_timeout(db, monkeypatch):
+    db.commit("screenshots", 1, 3)
+    feed = _feed()
+    feed.poll()
+    assert feed.stats()["gaps"] == 1
+    monkeypatch.setattr(events, "GAP_TIMEOUT", -1.0)
+    feed.poll()
+    assert feed.stats()["gaps"] == 0
+    db.commit("screenshots", 2)  # too late: treated as rolled back
+    assert feed.poll() == 0
+
+
+def test_gap_tracking_is_bounded(db, monkeypatch):
+    monkeypatch.setattr(events, "MAX_GAPS", 5)
+    db.commit("activity_events", 100)
+    feed = _feed()
+    assert feed.poll() == 1
+    assert feed.stats()["gaps"] == 5
+
+
+def test_catch_up_replays_between_cursors(db):
+    db.commit("activity_events", 1, 2, 3)
+    db.commit("screenshots", 1)
+    start = events.parse_cursor("1-0-0")
+    replay = events.catch_up(start, events.parse_cursor("3-1-0"))
+    assert [(e["type"], e["row_id"]) for e in replay] == [
+        ("activity", 2), ("activity", 3), ("screenshot", 1)]
+    assert replay[-1]["id"] == "3-1-0"
+    assert start == events.parse_cursor("1-0-0")
+
+
+def test_catch_up_gives_up_on_large_gaps(db, monkeypatch):
+    monkeypatch.setattr(events, "MAX_CATCHUP", 2)
+    db.commit("activity_events", 1, 2, 3)
+    assert events.catch_up(events.parse_cursor("0-0-0"), events.parse_cursor("3-0-0")) is None
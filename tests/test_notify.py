@@ -0,0 +1,152 @@
+import asyncio
+import socket
+import threading
+from email.message import EmailMessage
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+from backend.notify import EmailRefused, EmailSender  # noqa: E402
+
+
+class Recorder:
+    """aiosmtpd handler: keeps every accepted message; can drop or stall on demand."""
+
+    def __init__(self, drop_first=0, refuse=()):
+        self.received = []
+        self.drop_first = drop_first
+        self.refuse = set(refuse)
+        self.release = threading.Event()
+        self.release.set()
+        self.stalled = threading.Event()  # set once a message waits on `release`
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.drop_first:
+            self.drop_first -= 1
+            server.transport.close()  # client sees the session die mid-send
+            return "421 closing"
+        while not self.release.is_set():
+            self.stalled.set()
+            await asyncio.sleep(0.01)
+        self.received.append(envelope)
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    servers = []
+
+    def start(handler):
+        controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=_free_port())
+        controller.start()
+        servers.append(controller)
+        return controller
+
+    yield start
+    for controller in servers:
+        controller.stop()
+
+
+def _sender(controller, **kwargs):
+    config = {"host": controller.hostname, "port": controller.port,
+              "use_tls": False, "from_addr": "tracker@example.com"}
+    kwargs.setdefault("max_backoff", 0.05)
+    return EmailSender(config, **kwargs)
+
+
+def _message(subject, to="admin@example.com"):
+    msg = EmailMessage()
+    msg["From"] = "tracker@example.com"
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg.set_content("body")
+    return msg
+
+
+def test_delivers_over_one_session(smtp_server):
+    handler = Recorder()
+    sender = _sender(smtp_server(handler))
+    try:
+        futures = [sender.submit(_message(f"alert {i}")) for i in range(3)]
+        assert [f.result(10) for f in futures] == [True, True, True]
+    finally:
+        sender.stop()
+    assert [e.rcpt_tos for e in handler.received] == [["admin@example.com"]] * 3
+    assert b"Subject: alert 0" in handler.received[0].original_content
+    stats = sender.stats()
+    assert stats["sent"] == 3 and stats["failed"] == 0
+    assert stats["connects"] == 1
+
+
+def test_retries_after_dropped_connection(smtp_server):
+    handler = Recorder(drop_first=1)
+    sender = _sender(smtp_server(handler))
+    try:
+        assert sender.submit(_message("retry me")).result(10) is True
+    finally:
+        sender.stop()
+    assert len(handler.received) == 1
+    stats = sender.stats()
+    assert stats["sent"] == 1 and stats["failed"] == 0
+    assert stats["connects"] == 2
+
+
+def test_gives_up_after_max_attempts(smtp_server):
+    handler = Recorder(drop_first=5)
+    sender = _sender(smtp_server(handler), max_attempts=2)
+    try:
+        assert sender.submit(_message("doomed")).result(10) is False
+    finally:
+        sender.stop()
+    assert handler.received == []
+    assert sender.stats()["failed"] == 1
+
+
+def test_refused_recipient_is_final_and_keeps_the_session(smtp_server):
+    handler = Recorder(refuse={"gone@example.com"})
+    sender = _sender(smtp_server(handler), max_backoff=5.0)
+    try:
+        refused = sender.submit(_message("bounce", to="gone@example.com"))
+        with pytest.raises(EmailRefused) as info:
+            refused.result(10)
+        assert info.value.code == 550
+        assert sender.submit(_message("fine")).result(10) is True
+    finally:
+        sender.stop()
+    assert [e.rcpt_tos for e in handler.received] == [["admin@example.com"]]
+    stats = sender.stats()
+    assert stats["refused"] == 1 and stats["failed"] == 1 and stats["sent"] == 1
+    assert stats["connects"] == 1  # a rejection is not a dead connection: no reconnect, no backoff
+
+
+def test_full_queue_refuses_messages(smtp_server):
+    handler = Recorder()
+    handler.release.clear()  # the first message stalls in DATA
+    sender = _sender(smtp_server(handler), max_queue=1)
+    try:
+        first = sender.submit(_message("in flight"))
+        assert handler.stalled.wait(10)  # off the queue, being sent
+        second = sender.submit(_message("queued"))
+        assert second is not None
+        assert sender.submit(_message("overflow")) is None
+        assert sender.send(_message("overflow again")) is False
+        handler.release.set()
+        assert first.result(10) is True and second.result(10) is True
+    finally:
+        handler.release.set()
+        sender.stop()
+    assert len(handler.received) == 2
+    assert sender.stats()["dropped"] == 2
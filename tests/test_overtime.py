@@ -0,0 +1,93 @@
+import datetime as dt
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from backend import overtime  # noqa: E402
+
+H = 3600
+DAY = overtime.DAY
+
+
+def _arrays(*intervals):
+    uid, start, end = zip(*intervals)
+    return (np.array(uid, dtype=np.int64), np.array(start, dtype=np.int64),
+            np.array(end, dtype=np.int64))
+
+
+def _fake_db(monkeypatch, events, shifts):
+    """events: (user_id, occurred_at, active_seconds); shifts: user_id -> (start h, end h, seconds)."""
+    def iter_query(sql, params=()):
+        low, high = params[:2]
+        for uid, at, seconds in events:
+            if low <= at < high:
+                yield {"user_id": uid, "occurred_at": at, "active_duration_seconds": seconds}
+
+    def fetch_user_shifts(user_id=None):
+        return [{"id": uid, "shift_start": s * H, "shift_end": e * H, "shift_duration_seconds": d}
+                for uid, (s, e, d) in shifts.items() if user_id in (None, uid)]
+
+    monkeypatch.setattr(overtime, "iter_query", iter_query)
+    monkeypatch.setattr(overtime, "fetch_user_shifts", fetch_user_shifts)
+
+
+def test_split_at_midnight_cuts_every_day_boundary():
+    uid, start, end = overtime._split_at_midnight(*_arrays((1, 23 * H, 2 * DAY + 2 * H), (2, H, 2 * H)))
+    pieces = sorted(zip(uid.tolist(), start.tolist(), end.tolist()))
+    assert pieces == [(1, 23 * H, DAY), (1, DAY, 2 * DAY), (1, 2 * DAY, 2 * DAY + 2 * H),
+                      (2, H, 2 * H)]
+
+
+def test_split_at_midnight_keeps_an_interval_ending_at_midnight_whole():
+    uid, start, end = overtime._split_at_midnight(*_arrays((1, 20 * H, DAY)))
+    assert list(zip(start.tolist(), end.tolist())) == [(20 * H, DAY)]
+
+
+def test_split_at_midnight_of_nothing():
+    empty = np.zeros(0, dtype=np.int64)
+    assert all(a.size == 0 for a in overtime._split_at_midnight(empty, empty, empty))
+
+
+def test_shift_seconds_before_counts_whole_and_partial_shifts():
+    x = np.array([0, 9 * H, 12 * H, 17 * H, DAY, DAY + 10 * H], dtype=np.int64)
+    w = overtime._shift_seconds_before(x, 9 * H, 8 * H)
+    assert (np.diff(w) == [0, 3 * H, 5 * H, 0, H]).all()
+
+
+def test_shift_seconds_before_overnight_shift_runs_past_midnight():
+    # 22:00 for 8 hours: 2h before midnight, 6h after.
+    s, d = 22 * H, 8 * H
+    w = overtime._shift_seconds_before(np.array([20 * H, DAY, DAY + 6 * H, DAY + 20 * H]), s, d)
+    assert (np.diff(w) == [2 * H, 6 * H, 0]).all()
+
+
+def test_compute_overtime_outside_a_day_shift(monkeypatch):
+    day = dt.date(2025, 3, 3)
+    at = dt.datetime(2025, 3, 3, 18)
+    _fake_db(monkeypatch, [(1, at, 10 * H)], {1: (9, 17, 8 * H)})  # worked 08:00-18:00
+    assert overtime.compute_overtime(day, day) == [(1, day, 2 * H)]
+
+
+def test_compute_overtime_overnight_shift(monkeypatch):
+    first, second = dt.date(2025, 3, 3), dt.date(2025, 3, 4)
+    at = dt.datetime(2025, 3, 4, 7)
+    # 22:00-06:00 with no stored duration; worked 21:00-07:00.
+    _fake_db(monkeypatch, [(1, at, 10 * H)], {1: (22, 6, 0)})
+    assert overtime.compute_overtime(first, second) == [(1, first, H), (1, second, H)]
+
+
+def test_compute_overtime_clips_to_the_range(monkeypatch):
+    day = dt.date(2025, 3, 4)
+    _fake_db(monkeypatch, [
+        (1, dt.datetime(2025, 3, 4, 2), 4 * H),   # 22:00 the day before -> 02:00: 2h count
+        (1, dt.datetime(2025, 3, 5, 1), 3 * H),   # 22:00 -> 01:00 next day: 2h count
+        (1, dt.datetime(2025, 3, 3, 20), 2 * H),  # entirely before the range
+    ], {1: (9, 17, 8 * H)})
+    assert overtime.compute_overtime(day, day) == [(1, day, 4 * H)]
+
+
+def test_compute_overtime_skips_users_without_a_shift_row(monkeypatch):
+    day = dt.date(2025, 3, 3)
+    _fake_db(monkeypatch, [(2, dt.datetime(2025, 3, 3, 23), H)], {1: (9, 17, 8 * H)})
+    assert overtime.compute_overtime(day, day) == []
@@ -0,0 +1,29 @@
+from backend.reconcile import BloomFilter
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(5000, 0.01)
+    keys = [f"screenshots/{i:02x}/{i:064x}.png" for i in range(5000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_false_positive_rate_is_near_the_target():
+    bloom = BloomFilter(10000, 0.01)
+    for i in range(10000):
+        bloom.add(f"present/{i}")
+    false_hits = sum(f"absent/{i}" in bloom for i in range(20000))
+    assert false_hits / 20000 < 0.02
+
+
+def test_empty_filter_contains_nothing():
+    bloom = BloomFilter(0)
+    assert "avatars/a.png" not in bloom
+    assert bloom.nbytes >= 1
+
+
+def test_size_follows_the_expected_items():
+    small, large = BloomFilter(1000, 0.001), BloomFilter(100000, 0.001)
+    assert large.nbytes > 50 * small.nbytes
+    assert small.hashes == large.hashes == 10
@@ -0,0 +1,84 @@
+from backend.models import _UserCache
+
+
+def _row(uid, name="a"):
+    return {"id": uid, "username": name}
+
+
+def _fill(cache, key, row):
+    hit, started = cache.get(key)
+    assert hit is None
+    cache.put(key, row, started)
+
+
+def test_hit_after_fill_returns_a_copy():
+    cache = _UserCache(maxsize=10, ttl=60)
+    _fill(cache, ("id", 1), _row(1))
+    row, started = cache.get(("id", 1))
+    assert row == _row(1) and started is None
+    row["username"] = "changed"
+    assert cache.get(("id", 1))[0] == _row(1)
+
+
+def test_fill_started_before_an_invalidation_is_dropped():
+    cache = _UserCache(maxsize=10, ttl=60)
+    _hit, started = cache.get(("id", 1))
+    cache.invalidate(1)  # the user was written while we read the old row
+    cache.put(("id", 1), _row(1, "stale"), started)
+    assert cache.get(("id", 1))[0] is None
+
+
+def test_fill_started_after_the_invalidation_is_kept():
+    cache = _UserCache(maxsize=10, ttl=60)
+    cache.invalidate(1)
+    _fill(cache, ("id", 1), _row(1))
+    assert cache.get(("id", 1))[0] == _row(1)
+
+
+def test_invalidating_another_user_does_not_void_a_fill():
+    cache = _UserCache(maxsize=10, ttl=60)
+    _hit, started = cache.get(("id", 1))
+    cache.invalidate(2)
+    cache.put(("id", 1), _row(1), started)
+    assert cache.get(("id", 1))[0] == _row(1)
+
+
+def test_invalidate_drops_every_key_of_the_user():
+    cache = _UserCache(maxsize=10, ttl=60)
+    _fill(cache, ("id", 1), _row(1, "ann"))
+    _fill(cache, ("login", "ann"), _row(1, "ann"))
+    _fill(cache, ("id", 2), _row(2, "bob"))
+    cache.invalidate(1)
+    assert cache.get(("id", 1))[0] is None
+    assert cache.get(("login", "ann"))[0] is None
+    assert cache.get(("id", 2))[0] == _row(2, "bob")
+
+
+def test_epoch_table_overflow_voids_fills_in_flight():
+    cache = _UserCache(maxsize=2, ttl=60)
+    _hit, started = cache.get(("id", 1))
+    cache.invalidate(*range(100, 1200))  # more than max(maxsize, 1024) epochs
+    assert len(cache._epochs) <= 1100
+    cache.put(("id", 1), _row(1), started)
+    assert cache.get(("id", 1))[0] is None
+    _fill(cache, ("id", 1), _row(1))  # fills started afterwards work again
+    assert cache.get(("id", 1))[0] == _row(1)
+
+
+def test_clear_voids_fills_in_flight():
+    cache = _UserCache(maxsize=10, ttl=60)
+    _hit, started = cache.get(("id", 1))
+    cache.clear()
+    cache.put(("id", 1), _row(1), started)
+    assert cache.get(("id", 1))[0] is None
+
+
+def test_lru_eviction_and_expiry():
+    cache = _UserCache(maxsize=2, ttl=60)
+    for uid in (1, 2, 3):
+        _fill(cache, ("id", uid), _row(uid))
+    assert cache.get(("id", 1))[0] is None
+    assert cache.get(("id", 3))[0] == _row(3)
+    expired = _UserCache(maxsize=2, ttl=-1)
+    _fill(expired, ("id", 1), _row(1))
+    assert expired.get(("id", 1))[0] is None
@@ -0,0 +1,185 @@
+# backend/thumbnails.py
+"""
+Post-ingest screenshot pipeline.
+
+Screenshots arrive as PNG. In a process pool (image work is CPU-bound) each
+one is transcoded to WebP and a fixed-box thumbnail is rendered; both go into
+the media store, the row is pointed at the WebP and its thumb_url is set, and
+the PNG reference is released. The PNG is kept if WebP would not be smaller.
+Storing the results and updating the row (DB writes, fsyncs) runs on a small
+thread pool, not on the process pool's result-handling thread, so slow I/O
+never holds up the delivery of other renders.
+
+Requires Pillow built with WebP support; without it the pipeline is a no-op.
+"""
+import io
+import os
+import argparse
+import functools
+import threading
+import importlib.util
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from backend import media_store
+from backend.db import get_connection
+
+THUMB_SIZE = (320, 180)
+WEBP_QUALITY = 80
+THUMB_QUALITY = 70
+APPLY_WORKERS = 4
+
+
+@functools.lru_cache(maxsize=None)
+def available() -> bool:
+    """Pillow is installed and was built with WebP support."""
+    if importlib.util.find_spec("PIL") is None:
+        return False
+    from PIL import features
+    return bool(features.check("webp"))
+
+
+def _render(src_path, thumb_size, quality, thumb_quality):
+    """Runs in a worker process: returns (webp_bytes, thumb_bytes)."""
+    from PIL import Image
+
+    with Image.open(src_path) as im:
+        im.load()
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+        full = io.BytesIO()
+        im.save(full, "WEBP", quality=quality, method=4)
+        thumb = im.copy()
+        thumb.thumbnail(thumb_size)
+        small = io.BytesIO()
+        thumb.save(small, "WEBP", quality=thumb_quality, method=4)
+    return full.getvalue(), small.getvalue()
+
+
+class ScreenshotPipeline:
+    def __init__(self, max_workers=None, thumb_size=THUMB_SIZE,
+                 quality=WEBP_QUALITY, thumb_quality=THUMB_QUALITY, apply_workers=APPLY_WORKERS):
+        self.thumb_size = thumb_size
+        self.quality = quality
+        self.thumb_quality = thumb_quality
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
+        self._io = ThreadPoolExecutor(max_workers=apply_workers, thread_name_prefix="thumb-apply")
+
+    def submit(self, screenshot_id, url):
+        """Schedule one screenshot; the returned Future resolves once the row is updated."""
+        src_rel = media_store.relpath_from_url(url)
+        if src_rel is None:
+            raise ValueError(f"Not a media URL: {url}")
+        done = Future()
+        render = self._pool.submit(_render, media_store.abspath_for(src_rel),
+                                   self.thumb_size, self.quality, self.thumb_quality)
+        render.add_done_callback(
+            lambda f: self._hand_off(f, done, screenshot_id, url, src_rel))
+        return done
+
+    def _hand_off(self, render, done, screenshot_id, url, src_rel):
+        # Called on the process pool's manager thread: keep it short.
+        try:
+            self._io.submit(self._finish, render, done, screenshot_id, url, src_rel)
+        except RuntimeError as e:  # closed meanwhile
+            done.set_exception(e)
+
+    @staticmethod
+    def _finish(render, done, screenshot_id, url, src_rel):
+        try:
+            webp, thumb = render.result()
+            _apply(screenshot_id, url, src_rel, webp, thumb)
+        except BaseException as e:
+            done.set_exception(e)
+        else:
+            done.set_result(screenshot_id)
+
+    def process_pending(self, batch_size=200) -> dict:
+        """Backfill every screenshot without a thumbnail, in id order."""
+        stats = {"processed": 0, "failed": 0}
+        last_id = 0
+        while True:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, url FROM screenshots
+                    WHERE id > %s AND thumb_url IS NULL AND url IS NOT NULL AND url <> ''
+                    ORDER BY id LIMIT %s
+                """, (last_id, batch_size))
+                rows = cur.fetchall()
+            if not rows:
+                return stats
+            last_id = rows[-1]["id"]
+            futures = []
+            for r in rows:
+                try:
+                    futures.append(self.submit(r["id"], r["url"]))
+                except ValueError:
+                    stats["failed"] += 1
+            for fut in as_completed(futures):
+                if fut.exception() is None:
+                    stats["processed"] += 1
+                else:
+                    stats["failed"] += 1
+
+    def close(self, wait=True):
+        self._pool.shutdown(wait=wait)
+        self._io.shutdown(wait=wait)
+
+
+def _apply(screenshot_id, url, src_rel, webp, thumb):
+    _, thumb_url = media_store.store_bytes("screenshots", thumb, ".webp")
+    new_url, new_mime = url, None
+    if len(webp) < _size_of(src_rel):
+        _, new_url = media_store.store_bytes("screenshots", webp, ".webp")
+        new_mime = "image/webp"
+    with get_connection() as conn, conn.cursor() as cur:
+        # Guard on url so a row replaced or deleted meanwhile is left alone.
+        cur.execute("""
+            UPDATE screenshots SET url=%s, mime=COALESCE(%s, mime), thumb_url=%s
+            WHERE id=%s AND url=%s AND thumb_url IS NULL
+        """, (new_url, new_mime, thumb_url, screenshot_id, url))
+        updated = cur.rowcount
+    if not updated:
+        media_store.release_urls([thumb_url] + ([new_url] if new_url != url else []))
+    elif new_url != url:
+        media_store.release_urls([url])
+
+
+def _size_of(relpath):
+    try:
+        return os.path.getsize(media_store.abspath_for(relpath))
+    except OSError:
+        return 0
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> ScreenshotPipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = ScreenshotPipeline()
+    return _pipeline
+
+
+def submit(screenshot_id, url):
+    """Queue a freshly inserted screenshot; models.insert_screenshot_url calls this."""
+    if not available():
+        return None
+    return get_pipeline().submit(screenshot_id, url)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Transcode screenshots to WebP and build thumbnails")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    ap.add_argument("--batch-size", type=int, default=200)
+    args = ap.parse_args()
+    if not available():
+        raise SystemExit("Pillow with WebP support is not installed; nothing to do.")
+    pipeline = ScreenshotPipeline(max_workers=args.workers)
+    try:
+        print(f"[Thumbnails] {pipeline.process_pending(args.batch_size)}")
+    finally:
+        pipeline.close()